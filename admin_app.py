@@ -2,58 +2,53 @@
 Admin web application for managing bot users and sending updates.
 """
 
-import asyncio
+import base64
+import csv
+import io
+import json
 import logging
-import requests
+import threading
+import time
+import zlib
 from datetime import datetime
-from flask import Flask, render_template, request, jsonify, redirect, url_for, flash
-from database import db
-from config import BOT_TOKEN
+from flask import (
+    Flask, Response, render_template, request, jsonify, redirect, url_for, flash, stream_with_context,
+)
+from database import db, EXPORT_TABLES, ROLLUP_METRICS, USER_SORT_COLUMNS
+from broadcast import broadcaster
+from stats import stats_service
+from events import event_bus, parse_event_id, snapshot_event
+from config import (
+    REFERRAL_RECONCILE_INTERVAL, EXPORT_CHUNK_ROWS, STATS_REFRESH_INTERVAL,
+    ACTIVITY_MAX_POINTS, EVENT_HEARTBEAT_INTERVAL,
+)
 import os
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Reconnect delay suggested to EventSource clients of /api/stream
+EVENT_RECONNECT_MS = 3000
+
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Return the request thread's pooled connection."""
+    db.release_connection()
+
 @app.route('/')
 def dashboard():
     """Main dashboard showing user statistics."""
     try:
-        # Get user statistics
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # Total users
-        cursor.execute('SELECT COUNT(*) FROM users')
-        total_users = cursor.fetchone()[0]
-        
-        # Total balance distributed
-        cursor.execute('SELECT SUM(balance) FROM users')
-        total_balance = cursor.fetchone()[0] or 0
-        
-        # Total referrals
-        cursor.execute('SELECT COUNT(*) FROM users WHERE referrer_id IS NOT NULL')
-        total_referrals = cursor.fetchone()[0]
-        
-        # Recent users (last 10)
-        cursor.execute('''
-            SELECT user_id, username, full_name, balance, joined_at 
-            FROM users 
-            ORDER BY joined_at DESC 
-            LIMIT 10
-        ''')
-        recent_users = cursor.fetchall()
-        
-        conn.close()
-        
+        snapshot = stats_service.snapshot()
         stats = {
-            'total_users': total_users,
-            'total_balance': round(total_balance, 2),
-            'total_referrals': total_referrals,
-            'recent_users': recent_users
+            'total_users': snapshot['total_users'],
+            'total_balance': round(snapshot['total_balance'], 2),
+            'total_referrals': snapshot['total_referrals'],
+            'recent_users': snapshot['recent_users'][:10]
         }
         
         return render_template('dashboard.html', stats=stats)
@@ -62,28 +57,78 @@ def dashboard():
         flash(f"Error loading dashboard: {e}", 'error')
         return render_template('dashboard.html', stats={})
 
+def snapshot_response(name, builder):
+    """
+    Serve a JSON payload from the stats snapshot with caching headers.
+
+    Clients polling with If-None-Match get a 304 until the snapshot changes.
+    """
+    body, etag = stats_service.snapshot().render(name, builder)
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'private, max-age={STATS_REFRESH_INTERVAL}'
+    return response.make_conditional(request)
+
+USERS_PAGE_SIZE = 50
+
+def encode_cursor(cursor) -> str:
+    """Encode a keyset cursor for use in a URL."""
+    if cursor is None:
+        return ''
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+def decode_cursor(value: str):
+    """Decode a cursor produced by encode_cursor, or None if invalid."""
+    if not value:
+        return None
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(value.encode()))
+        return tuple(cursor) if isinstance(cursor, list) and len(cursor) == 2 else None
+    except (ValueError, TypeError):
+        return None
+
+def get_users_page():
+    """Fetch the users page described by the request's sort/q/cursor arguments."""
+    sort = request.args.get('sort', 'joined_at')
+    if sort not in USER_SORT_COLUMNS:
+        sort = 'joined_at'
+    search = request.args.get('q', '').strip()
+    after = decode_cursor(request.args.get('cursor', ''))
+    users, next_cursor = db.list_users(sort, after, search or None, USERS_PAGE_SIZE)
+    return users, encode_cursor(next_cursor), sort, search
+
 @app.route('/users')
 def users_list():
-    """Display all users with their information."""
+    """Display users one keyset page at a time, with search and sorting."""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT user_id, username, full_name, balance, 
-                   (SELECT COUNT(*) FROM users u2 WHERE u2.referrer_id = users.user_id) as referral_count,
-                   joined_at, wallet_address
-            FROM users 
-            ORDER BY joined_at DESC
-        ''')
-        users = cursor.fetchall()
-        conn.close()
-        
-        return render_template('users.html', users=users)
+        users, next_cursor, sort, search = get_users_page()
+        return render_template('users.html', users=users, next_cursor=next_cursor,
+                               sort=sort, search=search)
     except Exception as e:
         logger.error(f"Users list error: {e}")
         flash(f"Error loading users: {e}", 'error')
-        return render_template('users.html', users=[])
+        return render_template('users.html', users=[], next_cursor='', sort='joined_at', search='')
+
+@app.route('/api/users')
+def api_users():
+    """API endpoint returning one page of users for lazy loading."""
+    try:
+        users, next_cursor, sort, search = get_users_page()
+        return jsonify({
+            'users': [{
+                'user_id': user[0],
+                'username': user[1],
+                'full_name': user[2],
+                'balance': float(user[3] or 0),
+                'referral_count': user[4],
+                'joined_at': user[5],
+                'wallet_address': user[6],
+            } for user in users],
+            'next_cursor': next_cursor,
+        })
+    except Exception as e:
+        logger.error(f"API users error: {e}")
+        return jsonify({'error': str(e)}), 500
 
 @app.route('/broadcast')
 def broadcast_page():
@@ -121,21 +166,17 @@ def send_broadcast():
                 image_path = os.path.join(upload_dir, unique_filename)
                 image_file.save(image_path)
         
-        # Get all user IDs
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT user_id FROM users')
-        user_ids = [row[0] for row in cursor.fetchall()]
-        conn.close()
-        
-        if not user_ids:
-            flash('No users found to send message to', 'warning')
+        # Persist the broadcast and hand it to the background engine
+        job_id = broadcaster.enqueue(message, image_path, announcement_type)
+        if job_id is None:
+            flash('Could not create the announcement job', 'error')
             return redirect(url_for('broadcast_page'))
         
-        # Send messages using Telegram Bot API
-        success_count, failed_count = send_broadcast_sync(user_ids, message, image_path, announcement_type)
-        
-        flash(f'Announcement sent to {len(user_ids)} users successfully!', 'success')
+        job = db.get_broadcast_job(job_id)
+        if not job['total']:
+            flash('No users found to send message to', 'warning')
+        else:
+            flash(f'Announcement #{job_id} queued for {job["total"]} users!', 'success')
         return redirect(url_for('broadcast_page'))
         
     except Exception as e:
@@ -143,60 +184,22 @@ def send_broadcast():
         flash(f"Error sending announcement: {e}", 'error')
         return redirect(url_for('broadcast_page'))
 
-def send_broadcast_sync(user_ids, message, image_path=None, announcement_type='text'):
-    """Send broadcast message to users using Telegram Bot API."""
-    success_count = 0
-    failed_count = 0
-    
-    bot_token = os.getenv('BOT_TOKEN')
-    if not bot_token:
-        logger.error("BOT_TOKEN environment variable not set")
-        return success_count, failed_count
-    
-    for user_id in user_ids:
-        try:
-            import time
-            
-            if announcement_type == 'image' and image_path:
-                # Send photo with caption
-                url = f"https://api.telegram.org/bot{bot_token}/sendPhoto"
-                
-                with open(image_path, 'rb') as photo:
-                    files = {'photo': photo}
-                    data = {
-                        'chat_id': user_id,
-                        'caption': f"📢 <b>ANNOUNCEMENT</b> 📢\n\n{message}",
-                        'parse_mode': 'HTML'
-                    }
-                    
-                    response = requests.post(url, data=data, files=files, timeout=15)
-            else:
-                # Send text message
-                url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-                data = {
-                    'chat_id': user_id,
-                    'text': f"📢 <b>ANNOUNCEMENT</b> 📢\n\n{message}",
-                    'parse_mode': 'HTML'
-                }
-                
-                response = requests.post(url, data=data, timeout=10)
-            
-            if response.status_code == 200:
-                success_count += 1
-                logger.info(f"Announcement sent to user {user_id}")
-            else:
-                failed_count += 1
-                logger.error(f"Failed to send announcement to user {user_id}: {response.text}")
-            
-            # Small delay to avoid rate limiting
-            time.sleep(0.05)
-            
-        except Exception as e:
-            failed_count += 1
-            logger.error(f"Error sending announcement to user {user_id}: {e}")
-    
-    logger.info(f"Announcement completed: {success_count} successful, {failed_count} failed")
-    return success_count, failed_count
+@app.route('/api/broadcasts')
+def api_broadcasts():
+    """API endpoint listing recent broadcast jobs with progress."""
+    try:
+        return jsonify({'jobs': db.list_broadcast_jobs()})
+    except Exception as e:
+        logger.error(f"API broadcasts error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/broadcasts/<int:job_id>')
+def api_broadcast_job(job_id):
+    """API endpoint for one broadcast job's progress and throughput."""
+    job = db.get_broadcast_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
 
 @app.route('/user/<int:user_id>')
 def user_detail(user_id):
@@ -224,8 +227,6 @@ def user_detail(user_id):
         ''', (user_id,))
         referrals = cursor.fetchall()
         
-        conn.close()
-        
         return render_template('user_detail.html', user=user, referrals=referrals)
     except Exception as e:
         logger.error(f"User detail error: {e}")
@@ -248,23 +249,14 @@ def database_page():
         schema = cursor.fetchall()
         
         # Get some database stats
-        cursor.execute('SELECT COUNT(*) FROM users')
-        total_users = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT COUNT(*) FROM users WHERE balance > 0')
-        users_with_balance = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT AVG(balance) FROM users WHERE balance > 0')
-        avg_balance = cursor.fetchone()[0] or 0
-        
-        conn.close()
+        snapshot = stats_service.snapshot()
         
         db_stats = {
             'tables': tables,
             'schema': schema,
-            'total_users': total_users,
-            'users_with_balance': users_with_balance,
-            'avg_balance': round(avg_balance, 2)
+            'total_users': snapshot['total_users'],
+            'users_with_balance': snapshot['users_with_balance'],
+            'avg_balance': round(snapshot['avg_balance'], 2)
         }
         
         return render_template('database.html', stats=db_stats)
@@ -292,8 +284,6 @@ def execute_query():
         cursor.execute(query)
         results = cursor.fetchall()
         columns = [description[0] for description in cursor.description]
-        conn.close()
-        
         return render_template('query_results.html', 
                              results=results, 
                              columns=columns, 
@@ -323,8 +313,6 @@ def database_management():
         cursor.execute('PRAGMA table_info(users)')
         columns = [row[1] for row in cursor.fetchall()]
         
-        conn.close()
-        
         return render_template('database.html', 
                              tables=tables, 
                              users_data=users_data, 
@@ -334,64 +322,147 @@ def database_management():
         flash(f"Error loading database: {e}", 'error')
         return render_template('database.html', tables=[], users_data=[], columns=[])
 
+@app.route('/database/reconcile', methods=['POST'])
+def reconcile_database():
+    """Repair denormalized referral counts."""
+    fixed = db.reconcile_referral_counts()
+    flash(f'Referral counts reconciled: {fixed} users corrected', 'success')
+    return redirect(url_for('database_page'))
+
+def start_reconciliation_job(interval: int = REFERRAL_RECONCILE_INTERVAL):
+    """Periodically reconcile referral counts in a background thread."""
+    def run():
+        while True:
+            db.reconcile_referral_counts()
+            db.release_connection()
+            time.sleep(interval)
+    
+    thread = threading.Thread(target=run, name="reconcile-referrals", daemon=True)
+    thread.start()
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+def encode_export_chunks(columns, chunks, export_format):
+    """Yield encoded export text, one chunk of rows at a time."""
+    if export_format == 'ndjson':
+        for rows in chunks:
+            yield ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in rows)
+        return
+    
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield output.getvalue()
+        output.seek(0)
+        output.truncate()
+    if output.tell():
+        yield output.getvalue()
+
+def gzip_chunks(chunks):
+    """Gzip-compress a stream of text chunks on the fly."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
 @app.route('/database/export')
 def export_database():
-    """Export database as CSV."""
+    """
+    Stream a table export.
+
+    Query args: table (default users), format (csv or ndjson), gzip=1 to
+    compress on the fly, and since=<timestamp> for only rows added after it.
+    """
     try:
-        import csv
-        import io
-        from flask import make_response
-        
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users ORDER BY joined_at DESC')
-        users_data = cursor.fetchall()
-        
-        cursor.execute('PRAGMA table_info(users)')
-        columns = [row[1] for row in cursor.fetchall()]
-        
-        conn.close()
-        
-        # Create CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(columns)
-        writer.writerows(users_data)
-        
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
-        response.headers['Content-Disposition'] = 'attachment; filename=bot_users.csv'
-        
+        table = request.args.get('table', 'users')
+        export_format = request.args.get('format', 'csv')
+        since = request.args.get('since', '').strip().replace('T', ' ') or None
+        compress = request.args.get('gzip') in ('1', 'true')
+        if table not in EXPORT_TABLES or export_format not in EXPORT_FORMATS:
+            flash('Unsupported export table or format', 'error')
+            return redirect(url_for('database_page'))
+        if since:
+            datetime.fromisoformat(since)  # reject malformed timestamps
+        
+        columns, chunks = db.iter_export(table, since, EXPORT_CHUNK_ROWS)
+        body = encode_export_chunks(columns, chunks, export_format)
+        mimetype, extension = EXPORT_FORMATS[export_format]
+        filename = 'bot_users' if table == 'users' else table
+        filename = f"{filename}.{extension}"
+        if compress:
+            body = gzip_chunks(body)
+            mimetype = 'application/gzip'
+            filename += '.gz'
+        
+        response = Response(stream_with_context(body), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
         return response
     except Exception as e:
         logger.error(f"Database export error: {e}")
         flash(f"Error exporting database: {e}", 'error')
-        return redirect(url_for('database_management'))
+        return redirect(url_for('database_page'))
+
+def build_stats_payload(snapshot):
+    """Totals shown in the dashboard cards."""
+    return {
+        'total_users': snapshot['total_users'],
+        'total_balance': round(snapshot['total_balance'], 2),
+        'total_referrals': snapshot['total_referrals']
+    }
+
+def build_live_users_payload(snapshot):
+    """Recent joins and today / last-24h counts."""
+    users_list = []
+    for user in snapshot['recent_users']:
+        users_list.append({
+            'user_id': user[0],
+            'username': user[1] or 'No username',
+            'full_name': user[2] or 'No name',
+            'balance': float(user[3]),
+            'joined_at': user[4],
+            'time_ago': get_time_ago(user[4])
+        })
+    
+    return {
+        'recent_users': users_list,
+        'today_users': snapshot['today_users'],
+        'active_users': snapshot['active_users'],
+        'timestamp': snapshot.generated_at.isoformat()
+    }
+
+def build_activity_feed_payload(snapshot):
+    """Latest joins labelled as referrals or organic sign-ups."""
+    activity_list = []
+    for activity in snapshot['recent_users'][:30]:
+        activity_list.append({
+            'user_id': activity[0],
+            'username': activity[1] or 'Anonymous',
+            'full_name': activity[2] or 'Unknown User',
+            'balance': float(activity[3]),
+            'joined_at': activity[4],
+            'activity_type': 'referral' if activity[5] is not None else 'new_user',
+            'referrer_id': activity[5],
+            'time_ago': get_time_ago(activity[4])
+        })
+    
+    return {
+        'activities': activity_list,
+        'count': len(activity_list),
+        'last_update': snapshot.generated_at.isoformat()
+    }
 
 @app.route('/api/stats')
 def api_stats():
     """API endpoint for statistics."""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*) FROM users')
-        total_users = cursor.fetchone()[0]
-        
-        cursor.execute('SELECT SUM(balance) FROM users')
-        total_balance = cursor.fetchone()[0] or 0
-        
-        cursor.execute('SELECT COUNT(*) FROM users WHERE referrer_id IS NOT NULL')
-        total_referrals = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        return jsonify({
-            'total_users': total_users,
-            'total_balance': round(total_balance, 2),
-            'total_referrals': total_referrals
-        })
+        return snapshot_response('stats', build_stats_payload)
     except Exception as e:
         logger.error(f"API stats error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -400,55 +471,84 @@ def api_stats():
 def api_live_users():
     """API endpoint for live user activity."""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # Get all recent users
-        cursor.execute('''
-            SELECT user_id, username, full_name, balance, joined_at 
-            FROM users 
-            ORDER BY joined_at DESC
-            LIMIT 50
-        ''')
-        recent_users = cursor.fetchall()
-        
-        # Get users joined today
-        cursor.execute('''
-            SELECT COUNT(*) FROM users 
-            WHERE date(joined_at) = date('now')
-        ''')
-        today_users = cursor.fetchone()[0]
-        
-        # Get total active users (joined in last 24 hours)
-        cursor.execute('''
-            SELECT COUNT(*) FROM users 
-            WHERE datetime(joined_at) >= datetime('now', '-24 hours')
-        ''')
-        active_users = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        users_list = []
-        for user in recent_users:
-            users_list.append({
-                'user_id': user[0],
-                'username': user[1] or 'No username',
-                'full_name': user[2] or 'No name',
-                'balance': float(user[3]),
-                'joined_at': user[4],
-                'time_ago': get_time_ago(user[4])
-            })
-        
+        return snapshot_response('live-users', build_live_users_payload)
+    except Exception as e:
+        logger.error(f"API live users error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/activity')
+def api_activity():
+    """
+    Activity time series for charts, read from the hourly/daily rollups.
+
+    Query args: granularity (hour or day, default hour) and points (number
+    of buckets ending with the current one).
+    """
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in ACTIVITY_MAX_POINTS:
+        return jsonify({'error': f'Unknown granularity: {granularity}'}), 400
+    points = request.args.get('points', type=int) or (24 if granularity == 'hour' else 30)
+    points = max(1, min(points, ACTIVITY_MAX_POINTS[granularity]))
+    
+    try:
+        series = db.get_activity_series(granularity, points)
         return jsonify({
-            'recent_users': users_list,
-            'today_users': today_users,
-            'active_users': active_users,
-            'timestamp': datetime.now().isoformat()
+            'granularity': granularity,
+            'series': series,
+            'totals': {metric: sum(point[metric] for point in series) for metric in ROLLUP_METRICS}
         })
     except Exception as e:
-        logger.error(f"API live users error: {e}")
+        logger.error(f"API activity error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/stream')
+def api_stream():
+    """
+    Server-Sent Events live feed.
+
+    New clients first get a snapshot of the live stats and activity feed,
+    then the user_joined / referral events written after it, replayed from
+    the snapshot's last event ID since the snapshot may be a few seconds
+    old. Reconnecting clients send Last-Event-ID and get the events they
+    missed instead.
+    """
+    last_event_id = parse_event_id(request.headers.get('Last-Event-ID'))
+    initial = None
+    if last_event_id is None:
+        snapshot = stats_service.snapshot()
+        initial = {
+            'live': build_live_users_payload(snapshot),
+            'feed': build_activity_feed_payload(snapshot),
+        }
+        last_event_id = snapshot['last_event_id']
+    
+    # Subscribe before replaying so no event falls between the two
+    subscription = event_bus.subscribe()
+    
+    def generate():
+        try:
+            yield f"retry: {EVENT_RECONNECT_MS}\n\n"
+            seen_id = last_event_id
+            if initial is not None:
+                yield snapshot_event(initial)
+            for event in event_bus.replay(last_event_id):
+                seen_id = event.id
+                yield event.to_sse()
+            
+            while not subscription.closed:
+                event = subscription.get(timeout=EVENT_HEARTBEAT_INTERVAL)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                elif event.id > seen_id:
+                    yield event.to_sse()
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 def get_time_ago(timestamp_str):
     """Calculate time ago from timestamp."""
     try:
@@ -474,43 +574,7 @@ def get_time_ago(timestamp_str):
 def api_activity_feed():
     """API endpoint for real-time activity feed."""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # Get latest activities with user info (show all recent activity)
-        cursor.execute('''
-            SELECT u.user_id, u.username, u.full_name, u.balance, u.joined_at,
-                   CASE 
-                       WHEN u.referrer_id IS NOT NULL THEN 'referral'
-                       ELSE 'new_user'
-                   END as activity_type,
-                   u.referrer_id
-            FROM users u
-            ORDER BY u.joined_at DESC
-            LIMIT 30
-        ''')
-        activities = cursor.fetchall()
-        
-        conn.close()
-        
-        activity_list = []
-        for activity in activities:
-            activity_list.append({
-                'user_id': activity[0],
-                'username': activity[1] or 'Anonymous',
-                'full_name': activity[2] or 'Unknown User',
-                'balance': float(activity[3]),
-                'joined_at': activity[4],
-                'activity_type': activity[5],
-                'referrer_id': activity[6],
-                'time_ago': get_time_ago(activity[4])
-            })
-        
-        return jsonify({
-            'activities': activity_list,
-            'count': len(activity_list),
-            'last_update': datetime.now().isoformat()
-        })
+        return snapshot_response('activity-feed', build_activity_feed_payload)
     except Exception as e:
         logger.error(f"API activity feed error: {e}")
         return jsonify({'error': str(e)}), 500
@@ -614,5 +678,7 @@ def restart_bot():
 if __name__ == '__main__':
     # Initialize database
     db.init_database()
+    broadcaster.resume_unfinished()
+    start_reconciliation_job()
     logger.info("Admin web application starting...")
     app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
\ No newline at end of file
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Compare IntentRouter.match against the original auto-reply keyword scan.
+
+The original auto_reply_handler lowercased each message and checked every
+keyword of every intent as a substring, top to bottom. Both are timed over
+the same mix of ordinary messages and reported in messages per second.
+
+Usage: python bench/intent_router.py [--rounds N]
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Callable, Optional
+
+os.environ.setdefault('BOT_TOKEN', '123456:bench')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import AUTO_REPLY_INTENTS
+from utils import IntentRouter
+
+# Keyword chain of the original auto_reply_handler, checked top to bottom
+BASELINE_KEYWORDS = [
+    ('help', ['help', 'support', 'assist', 'how']),
+    ('balance', ['balance', 'money', 'usdt', 'earning', 'earn']),
+    ('withdraw', ['withdraw', 'payout', 'cash', 'payment']),
+    ('refer', ['refer', 'invite', 'friend', 'link']),
+    ('thanks', ['thank', 'thanks', 'good', 'great', 'awesome']),
+    ('greeting', ['hi', 'hello', 'hey', 'good morning', 'good evening']),
+]
+
+MESSAGES = [
+    "hello there", "how do I withdraw my usdt?", "what is my balance", "thanks a lot!",
+    "good morning", "can I invite a friend", "my payout is late", "this bot is awesome",
+    "ok", "when will I get paid", "send me the referral link please", "Hey!",
+    "I earned nothing today", "withdrawal pending for two days", "great job guys",
+]
+
+def linear_scan(text: str) -> Optional[str]:
+    """Substring scan of the original handler."""
+    text = text.lower()
+    for intent, keywords in BASELINE_KEYWORDS:
+        if any(word in text for word in keywords):
+            return intent
+    return None
+
+def rate(func: Callable[[str], Optional[str]], rounds: int) -> float:
+    """Messages matched per second over `rounds` passes through MESSAGES."""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in MESSAGES:
+            func(text)
+    return rounds * len(MESSAGES) / (time.perf_counter() - started)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20000,
+                        help='passes through the message mix (default: 20000)')
+    args = parser.parse_args(argv)
+
+    router = IntentRouter(AUTO_REPLY_INTENTS)
+    rate(router.match, args.rounds // 10), rate(linear_scan, args.rounds // 10)  # Warm up
+    router_rate = rate(router.match, args.rounds)
+    scan_rate = rate(linear_scan, args.rounds)
+    print(f"IntentRouter  {router_rate:12,.0f} msg/s")
+    print(f"linear scan   {scan_rate:12,.0f} msg/s")
+    print(f"speedup       {router_rate / scan_rate:12.2f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Compare update throughput of polling and webhook mode against a fake Bot API.
+
+A local aiohttp server stands in for api.telegram.org. It answers getMe,
+getChatMember (every user is a member), sendMessage and the rest, with an
+optional delay per call to model network latency. The real handlers, update
+scheduler and database run in-process, pointed at the fake server through
+TELEGRAM_API_URL and at a throwaway database.
+
+Each mode gets N /start updates from N new users at once: polling mode
+serves them through getUpdates, webhook mode POSTs them to the bot's
+webhook (at most WEBHOOK_MAX_CONNECTIONS at a time, like Telegram). An
+update's latency runs from when it is handed over until the bot's first
+reply to that user reaches the fake API.
+
+Usage: python bench/webhook_vs_polling.py [--updates N] [--api-delay SECONDS]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+# The bot's modules read these at import time
+API_PORT = free_port()
+os.environ.setdefault('BOT_TOKEN', '123456:bench')
+os.environ['TELEGRAM_API_URL'] = f'http://127.0.0.1:{API_PORT}'
+os.environ['WEBHOOK_SECRET'] = 'bench-secret'
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bot_users.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import ClientSession, web
+from aiogram import Dispatcher
+from aiogram.bot.api import TelegramAPIServer
+from aiogram.dispatcher.webhook import BOT_DISPATCHER_KEY
+
+from bot_context import BotContext
+from config import BOT_TOKEN, TELEGRAM_API_URL, WEBHOOK_MAX_CONNECTIONS
+from handlers import register_handlers
+from polling import BackpressureBot
+from scheduler import LatencyHistogram, UpdateScheduler
+from webhook import SECRET_TOKEN_HEADER, SecretTokenWebhookHandler, drain_updates
+
+WEBHOOK_PATH = '/webhook'
+
+class FakeBotAPI:
+    """Minimal Bot API: long-polled updates in, replies recorded per chat."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.updates: List[dict] = []
+        self.new_updates = asyncio.Event()
+        self.handed_over: Dict[int, float] = {}
+        self.histogram = LatencyHistogram()
+        self.expected = 0
+        self.done = asyncio.Event()
+        self.calls = 0
+
+    def reset(self, expected: int):
+        self.handed_over.clear()
+        self.histogram = LatencyHistogram()
+        self.expected = expected
+        self.done.clear()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+    def push_updates(self, updates: List[dict]):
+        """Queue updates for getUpdates, starting their latency clocks."""
+        now = time.monotonic()
+        for update in updates:
+            self.handed_over[update['message']['chat']['id']] = now
+        self.updates.extend(updates)
+        self.new_updates.set()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.calls += 1
+        method = request.match_info['method']
+        params = dict(await request.post())
+        if method == 'getUpdates':
+            return self.ok(await self.get_updates(params))
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if method == 'getMe':
+            return self.ok({'id': 42, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'})
+        if method == 'getChatMember':
+            user = {'id': int(params['user_id']), 'is_bot': False, 'first_name': 'User'}
+            return self.ok({'status': 'member', 'user': user})
+        if method == 'sendMessage':
+            chat_id = int(params['chat_id'])
+            self.record_reply(chat_id)
+            return self.ok({'message_id': 1, 'date': int(time.time()),
+                            'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')})
+        return self.ok(True)
+
+    async def get_updates(self, params: dict) -> List[dict]:
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 100))
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        if not self.updates:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), float(params.get('timeout', 0)))
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[:limit]
+
+    def record_reply(self, chat_id: int):
+        started = self.handed_over.pop(chat_id, None)
+        if started is None:
+            return  # Not the first reply to this user
+        self.histogram.observe(time.monotonic() - started)
+        if self.histogram.count == self.expected:
+            self.done.set()
+
+    @staticmethod
+    def ok(result) -> web.Response:
+        return web.json_response({'ok': True, 'result': result})
+
+def start_update(update_id: int, user_id: int) -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': '/start',
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+            'chat': {'id': user_id, 'type': 'private'}, 'from': user,
+        },
+    }
+
+async def make_dispatcher() -> Dispatcher:
+    """Bot and dispatcher set up like main.py, with a fresh scheduler."""
+    scheduler = UpdateScheduler()
+    bot = BackpressureBot(token=BOT_TOKEN, server=TelegramAPIServer.from_base(TELEGRAM_API_URL),
+                          scheduler=scheduler)
+    dp = Dispatcher(bot)
+    dp.middleware.setup(scheduler)
+    register_handlers(dp, await BotContext.create(bot))
+    return dp
+
+async def run_polling(api: FakeBotAPI, updates: List[dict]) -> float:
+    dp = await make_dispatcher()
+    polling = asyncio.create_task(dp.start_polling())
+    await asyncio.sleep(0.2)  # Let the first getUpdates arrive
+
+    started = time.monotonic()
+    api.push_updates(updates)
+    await api.done.wait()
+    elapsed = time.monotonic() - started
+
+    dp.stop_polling()
+    api.new_updates.set()
+    await polling
+    await (await dp.bot.get_session()).close()
+    return elapsed
+
+async def run_webhook(api: FakeBotAPI, updates: List[dict]) -> float:
+    dp = await make_dispatcher()
+    app = web.Application()
+    app[BOT_DISPATCHER_KEY] = dp
+    app.router.add_route('*', WEBHOOK_PATH, SecretTokenWebhookHandler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+
+    url = f'http://127.0.0.1:{port}{WEBHOOK_PATH}'
+    headers = {SECRET_TOKEN_HEADER: os.environ['WEBHOOK_SECRET']}
+    connections = asyncio.Semaphore(WEBHOOK_MAX_CONNECTIONS)
+
+    async with ClientSession() as session:
+        async def deliver(update: dict):
+            async with connections:
+                api.handed_over[update['message']['chat']['id']] = time.monotonic()
+                async with session.post(url, data=json.dumps(update), headers=headers) as response:
+                    response.raise_for_status()
+
+        started = time.monotonic()
+        await asyncio.gather(*(deliver(update) for update in updates))
+        await api.done.wait()
+        elapsed = time.monotonic() - started
+
+    await drain_updates()
+    await runner.cleanup()
+    await (await dp.bot.get_session()).close()
+    return elapsed
+
+def report(mode: str, count: int, elapsed: float, histogram: LatencyHistogram):
+    s = histogram.summary()
+    print(f"{mode:<8} {count:>6} updates  {elapsed:7.2f} s  {count / elapsed:8.1f} updates/s  "
+          f"p50<={s['p50']} ms  p99<={s['p99']} ms  max={s['max']} ms")
+
+async def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--updates', type=int, default=1000, help='updates per mode (default: 1000)')
+    parser.add_argument('--api-delay', type=float, default=0.02,
+                        help='seconds the fake API takes per call (default: 0.02)')
+    args = parser.parse_args(argv)
+
+    api = FakeBotAPI(args.api_delay)
+    runner = web.AppRunner(api.app())
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', API_PORT).start()
+
+    print(f"{args.updates} /start updates per mode, fake Bot API delay {args.api_delay * 1000:.0f} ms")
+    try:
+        for index, (mode, run) in enumerate((('polling', run_polling), ('webhook', run_webhook))):
+            # New users in each mode so every update registers one
+            first_id = 1_000_000 * (index + 1)
+            updates = [start_update(first_id + i, first_id + i) for i in range(args.updates)]
+            api.reset(args.updates)
+            elapsed = await run(api, updates)
+            report(mode, args.updates, elapsed, api.histogram)
+    finally:
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main())
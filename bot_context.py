@@ -0,0 +1,49 @@
+"""
+Bot identity shared with the handlers.
+"""
+
+import logging
+from aiogram import Bot
+
+logger = logging.getLogger(__name__)
+
+class BotContext:
+    """
+    The bot instance plus its identity, fetched once with getMe at startup.
+
+    Handlers receive this object instead of calling bot.get_me(), so
+    referral links are built locally without a Bot API round-trip.
+    """
+
+    def __init__(self, bot: Bot, bot_id: int, username: str, first_name: str = ""):
+        self.bot = bot
+        self.id = bot_id
+        self.username = username
+        self.first_name = first_name
+
+    @classmethod
+    async def create(cls, bot: Bot) -> "BotContext":
+        """
+        Fetch the bot's identity from Telegram.
+
+        Args:
+            bot: Bot instance
+
+        Returns:
+            BotContext: Context for the bot
+        """
+        me = await bot.get_me()
+        logger.info(f"Running as @{me.username} ({me.id})")
+        return cls(bot, me.id, me.username, me.first_name)
+
+    def referral_link(self, user_id: int) -> str:
+        """
+        Build a user's referral link.
+
+        Args:
+            user_id: Telegram user ID of the referrer
+
+        Returns:
+            str: t.me deep link that starts the bot with the referrer's ID
+        """
+        return f"https://t.me/{self.username}?start={user_id}"
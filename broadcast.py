@@ -0,0 +1,457 @@
+"""
+Broadcast engine for sending announcements to all bot users.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from config import (
+    BOT_TOKEN, TELEGRAM_API_URL, BROADCAST_GLOBAL_RATE, BROADCAST_PER_CHAT_RATE,
+    BROADCAST_CONCURRENCY, BROADCAST_MAX_RETRIES, BROADCAST_CHECKPOINT_SIZE,
+    BROADCAST_CHECKPOINT_INTERVAL, BROADCAST_FETCH_SIZE, BROADCAST_HEARTBEAT_INTERVAL,
+    BROADCAST_CLAIM_TIMEOUT,
+)
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+# Identifies this process as the owner of the broadcast jobs it sends
+BROADCAST_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+class TokenBucket:
+    """
+    Adaptive async token-bucket rate limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. A
+    pause() (e.g. after a 429 retry_after) blocks every caller until it ends
+    and halves the rate; each run of successful sends then raises it again
+    step by step, up to `max_rate`.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 min_rate: float = 1.0, increase_every: int = 50):
+        self.rate = rate
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.increase_every = increase_every
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._successes = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for the given number of seconds and back off."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+        self._successes = 0
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def record_success(self):
+        """Count a successful send, creeping the rate back up to max_rate."""
+        self._successes += 1
+        if self.rate < self.max_rate and self._successes >= self.increase_every:
+            self._successes = 0
+            self.rate = min(self.max_rate, self.rate + 1)
+
+class PerChatLimiter:
+    """Spaces out messages to the same chat to at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_slot: Dict[int, float] = {}
+
+    async def wait(self, chat_id: int):
+        """Wait until the chat may receive another message."""
+        now = time.monotonic()
+        slot = max(now, self._next_slot.get(chat_id, 0.0))
+        self._next_slot[chat_id] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        if len(self._next_slot) > 100000:
+            self._next_slot = {k: v for k, v in self._next_slot.items() if v > now}
+
+class TelegramSender:
+    """
+    Sends Bot API messages over a shared keep-alive connection pool while
+    respecting Telegram's global and per-chat rate limits.
+    """
+
+    def __init__(self, bot_token: str = BOT_TOKEN, rate: float = BROADCAST_GLOBAL_RATE,
+                 per_chat_rate: float = BROADCAST_PER_CHAT_RATE,
+                 concurrency: int = BROADCAST_CONCURRENCY, max_retries: int = BROADCAST_MAX_RETRIES):
+        self.base_url = f"{TELEGRAM_API_URL}/bot{bot_token}"
+        self.bucket = TokenBucket(rate)
+        self.per_chat = PerChatLimiter(per_chat_rate)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        self._session = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=30)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+        self._session = None
+
+    async def call(self, method: str, chat_id: int, data) -> dict:
+        """
+        Call a Bot API method for one chat, retrying on 429 and network errors.
+
+        `data` is a dict of fields, or a callable returning a fresh
+        aiohttp.FormData for each attempt (multipart bodies are single-use).
+
+        Returns:
+            dict: Telegram's response; "ok" is False if the call finally failed
+        """
+        response = {'ok': False, 'description': 'not sent'}
+        for attempt in range(self.max_retries + 1):
+            await self.per_chat.wait(chat_id)
+            await self.bucket.acquire()
+            payload = data() if callable(data) else data
+            try:
+                async with self._session.post(f"{self.base_url}/{method}", data=payload) as resp:
+                    response = await resp.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                response = {'ok': False, 'description': str(e)}
+                if attempt < self.max_retries:
+                    await asyncio.sleep(2 ** attempt)
+                continue
+
+            if response.get('ok'):
+                self.bucket.record_success()
+                return response
+            retry_after = response.get('parameters', {}).get('retry_after')
+            if response.get('error_code') == 429 and retry_after:
+                self.bucket.pause(retry_after)
+                logger.warning(f"Rate limited by Telegram, pausing {retry_after}s "
+                               f"and slowing to {self.bucket.rate:.0f} msg/s")
+                continue
+            return response
+        return response
+
+    async def send_message(self, chat_id: int, text: str) -> dict:
+        """Send an HTML text message."""
+        return await self.call('sendMessage', chat_id, {
+            'chat_id': chat_id,
+            'text': text,
+            'parse_mode': 'HTML',
+        })
+
+    async def send_photo(self, chat_id: int, caption: str, file_id: str) -> dict:
+        """Send an already uploaded photo by its Telegram file_id."""
+        return await self.call('sendPhoto', chat_id, {
+            'chat_id': chat_id,
+            'photo': file_id,
+            'caption': caption,
+            'parse_mode': 'HTML',
+        })
+
+    async def upload_photo(self, chat_id: int, caption: str, image_path: str) -> dict:
+        """Upload a photo from a local file and send it with an HTML caption."""
+        with open(image_path, 'rb') as photo:
+            photo_bytes = photo.read()
+
+        def form():
+            data = aiohttp.FormData()
+            data.add_field('chat_id', str(chat_id))
+            data.add_field('caption', caption)
+            data.add_field('parse_mode', 'HTML')
+            data.add_field('photo', photo_bytes, filename=os.path.basename(image_path))
+            return data
+
+        return await self.call('sendPhoto', chat_id, form)
+
+class PhotoSource:
+    """
+    Sends one image to many chats while uploading it at most once.
+
+    The first send uploads the file and captures the returned file_id, which
+    every later send reuses. The file_id is stored in the media cache keyed by
+    the file's SHA-256, so later broadcasts of the same image skip the upload
+    entirely.
+    """
+
+    def __init__(self, sender: TelegramSender, image_path: str, database: Database = db):
+        self.sender = sender
+        self.image_path = image_path
+        self.db = database
+        self.digest: Optional[str] = None
+        self.file_id: Optional[str] = None
+        self._upload_lock = asyncio.Lock()
+
+    async def load(self):
+        """Look up a cached file_id for the image."""
+        self.digest = await _run_in_thread(_file_digest, self.image_path)
+        self.file_id = await _run_in_thread(self.db.get_media_file_id, self.digest)
+
+    async def send(self, chat_id: int, caption: str) -> dict:
+        """Send the image to a chat, uploading it if no file_id is known yet."""
+        file_id = self.file_id
+        if file_id:
+            response = await self.sender.send_photo(chat_id, caption, file_id)
+            if response.get('ok') or 'file' not in str(response.get('description', '')).lower():
+                return response
+            # The cached file_id was rejected (e.g. the bot token changed)
+            logger.warning(f"Cached file_id for {self.image_path} rejected, uploading again")
+            if self.file_id == file_id:
+                self.file_id = None
+
+        async with self._upload_lock:
+            if self.file_id:
+                return await self.sender.send_photo(chat_id, caption, self.file_id)
+            response = await self.sender.upload_photo(chat_id, caption, self.image_path)
+            photos = response.get('result', {}).get('photo') if response.get('ok') else None
+            if photos:
+                self.file_id = photos[-1]['file_id']
+                await _run_in_thread(self.db.cache_media_file_id, self.digest, self.file_id)
+            return response
+
+def _file_digest(path: str) -> str:
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def format_announcement(message: str) -> str:
+    """Wrap an admin message in the announcement header."""
+    return f"📢 <b>ANNOUNCEMENT</b> 📢\n\n{message}"
+
+def format_notification(message: str) -> str:
+    """Wrap a command-line message in the notification header."""
+    return f"📢 NOTIFICATION 📢\n\n{message}"
+
+async def _run_in_thread(func, *args):
+    """Run a blocking database call off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, func, *args)
+
+async def run_broadcast_job(job_id: int, database: Database = db, concurrency: int = BROADCAST_CONCURRENCY,
+                            on_result: Optional[Callable[[int, bool], None]] = None) -> Optional[dict]:
+    """
+    Deliver a persisted broadcast job, resuming after any earlier run.
+
+    The job's message is sent verbatim; callers format it before creating
+    the job.
+
+    The job is claimed for this process first and kept alive with a
+    heartbeat every BROADCAST_HEARTBEAT_INTERVAL seconds, so the admin panel
+    and send_notification.py never send the same job at once. A job whose
+    owner stopped heartbeating for BROADCAST_CLAIM_TIMEOUT seconds can be
+    taken over.
+
+    Recipients are streamed from the database in user_id order, skipping
+    users who already have a delivery record. Delivery results are
+    checkpointed in batches of BROADCAST_CHECKPOINT_SIZE (or every
+    BROADCAST_CHECKPOINT_INTERVAL seconds), so after a crash only the last
+    uncommitted batch can be sent twice.
+
+    Args:
+        job_id: ID of a row in broadcast_jobs
+        database: Database holding the job
+        concurrency: Simultaneous in-flight requests
+        on_result: Called with (user_id, delivered) after every send attempt
+
+    Returns:
+        dict: The job row after the run, or None if it does not exist or
+            another process is sending it
+    """
+    job = await _run_in_thread(database.get_broadcast_job, job_id)
+    if job is None:
+        logger.error(f"Broadcast job {job_id} not found")
+        return None
+
+    now = time.time()
+    if not await _run_in_thread(database.claim_broadcast_job, job_id, BROADCAST_OWNER,
+                                now, now - BROADCAST_CLAIM_TIMEOUT):
+        logger.warning(f"Broadcast job {job_id} is finished or being sent by another process")
+        return None
+
+    try:
+        return await _deliver_broadcast_job(job, database, concurrency, on_result)
+    finally:
+        await _run_in_thread(database.release_broadcast_job, job_id, BROADCAST_OWNER)
+
+async def _deliver_broadcast_job(job: dict, database: Database, concurrency: int,
+                                 on_result: Optional[Callable[[int, bool], None]]) -> dict:
+    """Send a claimed job to its remaining recipients (see run_broadcast_job)."""
+    job_id = job['id']
+    await _run_in_thread(database.set_broadcast_job_status, job_id, 'running')
+    text = job['message']
+    is_image = job['announcement_type'] == 'image' and job['image_path']
+    pending: List[Tuple[int, str, Optional[str]]] = []
+    last_checkpoint = time.monotonic()
+    taken_over = asyncio.Event()
+
+    async def checkpoint():
+        nonlocal last_checkpoint
+        last_checkpoint = time.monotonic()
+        if pending:
+            batch = pending[:]
+            del pending[:]
+            await _run_in_thread(database.record_broadcast_deliveries, job_id, batch)
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(BROADCAST_HEARTBEAT_INTERVAL)
+            if not await _run_in_thread(database.heartbeat_broadcast_job, job_id, BROADCAST_OWNER, time.time()):
+                logger.error(f"Broadcast job {job_id} was taken over by another process, stopping")
+                taken_over.set()
+                return
+
+    async with TelegramSender(concurrency=concurrency) as sender:
+        photo = None
+        if is_image:
+            photo = PhotoSource(sender, job['image_path'], database)
+            await photo.load()
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=sender.concurrency * 2)
+
+        async def worker():
+            while True:
+                user_id = await queue.get()
+                try:
+                    if photo:
+                        response = await photo.send(user_id, text)
+                    else:
+                        response = await sender.send_message(user_id, text)
+                    if response.get('ok'):
+                        pending.append((user_id, 'sent', None))
+                    else:
+                        pending.append((user_id, 'failed', response.get('description')))
+                        logger.error(f"Failed to send announcement to user {user_id}: {response.get('description')}")
+                    if on_result:
+                        on_result(user_id, response.get('ok', False))
+                    if (len(pending) >= BROADCAST_CHECKPOINT_SIZE
+                            or time.monotonic() - last_checkpoint >= BROADCAST_CHECKPOINT_INTERVAL):
+                        await checkpoint()
+                except Exception as e:
+                    pending.append((user_id, 'failed', str(e)))
+                    logger.error(f"Error sending announcement to user {user_id}: {e}")
+                    if on_result:
+                        on_result(user_id, False)
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(sender.concurrency)]
+        heartbeat_task = asyncio.create_task(heartbeat())
+        try:
+            after_user_id = -1
+            while not taken_over.is_set():
+                batch = await _run_in_thread(
+                    database.get_broadcast_recipients, job_id, after_user_id, BROADCAST_FETCH_SIZE
+                )
+                if not batch:
+                    break
+                for user_id in batch:
+                    if taken_over.is_set():
+                        break
+                    await queue.put(user_id)
+                after_user_id = batch[-1]
+            if not taken_over.is_set():
+                await queue.join()
+        finally:
+            heartbeat_task.cancel()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(heartbeat_task, *workers, return_exceptions=True)
+            await checkpoint()
+
+    if not taken_over.is_set():
+        await _run_in_thread(database.set_broadcast_job_status, job_id, 'done')
+    job = await _run_in_thread(database.get_broadcast_job, job_id)
+    logger.info(f"Broadcast job {job_id} completed: {job['sent']} successful, {job['failed']} failed")
+    return job
+
+class BroadcastManager:
+    """
+    Runs persisted broadcast jobs one at a time on a dedicated event loop
+    thread, so the Flask request that starts a broadcast can return
+    immediately. Jobs run sequentially so they share one rate limit.
+    """
+
+    def __init__(self, database: Database = db):
+        self.db = database
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._job_lock: Optional[asyncio.Lock] = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=self._loop.run_forever, name="broadcast", daemon=True)
+                thread.start()
+            return self._loop
+
+    async def _run(self, job_id: int):
+        if self._job_lock is None:
+            self._job_lock = asyncio.Lock()
+        async with self._job_lock:
+            try:
+                await run_broadcast_job(job_id, self.db)
+            except Exception as e:
+                logger.error(f"Broadcast job {job_id} failed: {e}")
+                await _run_in_thread(self.db.set_broadcast_job_status, job_id, 'failed')
+
+    def submit(self, job_id: int):
+        """Schedule an existing job on the background loop."""
+        asyncio.run_coroutine_threadsafe(self._run(job_id), self._ensure_loop())
+
+    def enqueue(self, message: str, image_path: Optional[str] = None,
+                announcement_type: str = 'text') -> Optional[int]:
+        """Persist a new broadcast job, start it in the background and return its ID."""
+        job_id = self.db.create_broadcast_job(format_announcement(message), announcement_type, image_path)
+        if job_id is not None:
+            self.submit(job_id)
+            logger.info(f"Broadcast job {job_id} queued")
+        return job_id
+
+    def resume_unfinished(self) -> List[int]:
+        """
+        Restart every job that was queued or interrupted by a restart.
+
+        Jobs another process (e.g. send_notification.py --resume) is still
+        heartbeating are left to it.
+        """
+        job_ids = self.db.get_unfinished_broadcast_jobs(time.time() - BROADCAST_CLAIM_TIMEOUT)
+        for job_id in job_ids:
+            logger.info(f"Resuming broadcast job {job_id}")
+            self.submit(job_id)
+        return job_ids
+
+# Global broadcast manager
+broadcaster = BroadcastManager()
@@ -10,6 +10,23 @@ BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN environment variable is required")
 
+# How the bot receives updates: "polling" (getUpdates loop) or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# Webhook settings (BOT_MODE=webhook)
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "")  # public base URL, e.g. https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = f"{WEBHOOK_HOST.rstrip('/')}{WEBHOOK_PATH}"
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # sent back by Telegram in every webhook request
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0")
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8443"))
+WEBHOOK_MAX_CONNECTIONS = 100  # parallel webhook connections Telegram may open (1-100)
+
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"BOT_MODE must be 'polling' or 'webhook', not {BOT_MODE!r}")
+if BOT_MODE == "webhook" and not (WEBHOOK_HOST and WEBHOOK_SECRET):
+    raise ValueError("WEBHOOK_HOST and WEBHOOK_SECRET environment variables are required in webhook mode")
+
 # Channel list with usernames (not invite links)
 CHANNELS = [
     {"name": "Restrictionlesschat", "username": "Restrictionlesschat"},
@@ -28,10 +45,76 @@ MESSAGES = {
     "checking": "🔍 Checking your membership status...",
 }
 
+# Auto-reply intents for free-text messages, in priority order: the first
+# intent with a keyword in the message wins. Keywords match whole words
+# (case-insensitive); a trailing "*" also matches longer words starting
+# with the keyword ("refer*" matches "referral").
+AUTO_REPLY_INTENTS = [
+    ("help", ["help", "support", "assist", "how"]),
+    ("balance", ["balance", "money", "usdt", "earn*"]),
+    ("withdraw", ["withdraw*", "payout*", "cash", "payment*"]),
+    ("refer", ["refer*", "invite*", "friend*", "link*"]),
+    ("thanks", ["thank*", "good", "great", "awesome"]),
+    ("greeting", ["hi", "hello", "hey", "good morning", "good evening"]),
+]
+# Optional JSON file replacing the table above without code changes:
+# {"help": ["help", ...], "balance": [...], ...} with keys in priority order
+AUTO_REPLY_KEYWORDS_FILE = os.getenv("AUTO_REPLY_KEYWORDS_FILE", "")
+
 # Bot settings
 VERIFICATION_TIMEOUT = 30  # seconds to wait between verification attempts
+MEMBERSHIP_CHECK_DEADLINE = 5.0  # seconds allowed for all channel checks of one request
+MEMBERSHIP_CACHE_SIZE = 50000  # (user, channel) membership results kept in memory
+MEMBERSHIP_CACHE_POSITIVE_TTL = 600  # seconds a confirmed membership is trusted
+MEMBERSHIP_CACHE_NEGATIVE_TTL = VERIFICATION_TIMEOUT  # seconds a failed check is trusted
+MEMBERSHIP_CACHE_STATS_INTERVAL = 300  # seconds between membership cache hit/miss reports in the log
+UPDATE_CONCURRENCY = 64  # updates handled at the same time (one user's updates always run in order)
+UPDATE_MAX_PENDING = 1000  # updates in progress or waiting before webhook requests are refused with 429
+UPDATE_RETRY_AFTER = 5  # seconds Telegram is asked to wait before redelivering a refused update
+UPDATE_STATS_INTERVAL = 300  # seconds between update latency reports in the log
+
+# Database settings
+DATABASE_PATH = os.getenv("DATABASE_PATH", "bot_users.db")
+DB_POOL_SIZE = 8  # idle connections kept open for reuse
+DB_CACHE_SIZE_KB = 16384  # per-connection page cache (PRAGMA cache_size)
+DB_MMAP_SIZE = 64 * 1024 * 1024  # bytes of the DB file memory-mapped per connection
+DB_BUSY_TIMEOUT_MS = 5000  # how long a writer waits for a lock before failing
+DB_STATEMENT_CACHE = 256  # prepared statements cached per connection
+DB_READER_THREADS = 4  # threads serving async reads next to the single writer thread
+USER_CACHE_SIZE = 100000  # user records (balance, referral count) cached in memory
+USER_CACHE_TTL = 300  # seconds a cached user record is trusted (bounds staleness from admin writes)
+LEDGER_APPLY_INTERVAL = 1.0  # seconds between folds of pending ledger entries into balances
+LEDGER_APPLY_BATCH = 5000  # ledger entries folded per transaction
+EXPORT_CHUNK_ROWS = 1000  # rows read and streamed per chunk by /database/export
+
+# Broadcast settings
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+BROADCAST_GLOBAL_RATE = 30  # messages per second across all chats (Telegram limit)
+BROADCAST_PER_CHAT_RATE = 1  # messages per second to a single chat (Telegram limit)
+BROADCAST_CONCURRENCY = 20  # simultaneous in-flight requests / pooled connections
+BROADCAST_MAX_RETRIES = 3  # retries per message after 429s or network errors
+BROADCAST_CHECKPOINT_SIZE = 100  # delivery results committed per checkpoint
+BROADCAST_CHECKPOINT_INTERVAL = 2.0  # seconds between checkpoints at low send rates
+BROADCAST_FETCH_SIZE = 500  # recipients read from the database per batch
+BROADCAST_HEARTBEAT_INTERVAL = 10  # seconds between liveness stamps of the process sending a job
+BROADCAST_CLAIM_TIMEOUT = 60  # seconds without a heartbeat before another process may take over a job
+
+# Admin panel settings
+STATS_REFRESH_INTERVAL = 5  # seconds a dashboard statistics snapshot is served before refreshing
+STATS_RECENT_USERS = 50  # recently joined users kept in the snapshot
+ACTIVITY_MAX_POINTS = {'hour': 24 * 14, 'day': 365}  # longest activity time series served per granularity
+EVENT_POLL_INTERVAL = 0.5  # seconds between checks of the database for new live feed events
+EVENT_HEARTBEAT_INTERVAL = 15  # seconds between keep-alive comments on idle /api/stream connections
+EVENT_SUBSCRIBER_QUEUE = 1000  # events buffered per live feed client before it is disconnected
+EVENT_RETENTION = 10000  # newest events kept for clients resuming with Last-Event-ID
+EVENT_PRUNE_INTERVAL = 3600  # seconds between trims of the events table down to EVENT_RETENTION (done by the bot)
 
 # Referral system settings
 REFERRAL_REWARD = 0.1  # USDT per referral
 WELCOME_BONUS = 0.1  # USDT welcome bonus for new users
 MINIMUM_WITHDRAWAL = 1.0  # Minimum USDT to withdraw
+REFERRAL_RECONCILE_INTERVAL = 3600  # seconds between referral count drift repairs
+NOTIFY_QUEUE_SIZE = 10000  # referral notifications waiting to be sent before new ones are dropped
+NOTIFY_BATCH_WINDOW = 2.0  # seconds referrals are collected so one referrer gets one message
+NOTIFY_RATE = 10  # referral notifications per second, leaving headroom for replies
+NOTIFY_MAX_RETRIES = 3  # retries per notification after a 429
@@ -2,62 +2,425 @@
 Database management for user referrals and earnings.
 """
 
+import asyncio
+import functools
 import sqlite3
 import logging
-from typing import Optional, Tuple
-from config import REFERRAL_REWARD, WELCOME_BONUS
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional, Tuple
+from config import (
+    REFERRAL_REWARD, WELCOME_BONUS, DATABASE_PATH, DB_POOL_SIZE,
+    DB_CACHE_SIZE_KB, DB_MMAP_SIZE, DB_BUSY_TIMEOUT_MS, DB_STATEMENT_CACHE,
+    DB_READER_THREADS, LEDGER_APPLY_INTERVAL, LEDGER_APPLY_BATCH, USER_CACHE_SIZE, USER_CACHE_TTL,
+    EVENT_RETENTION, EVENT_PRUNE_INTERVAL,
+)
+from cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+class ConnectionPool:
+    """
+    Pool of persistent SQLite connections.
+
+    Each thread holds on to one connection until it calls release(), so the
+    bot's event loop thread keeps a single connection for its whole lifetime
+    and Flask request threads borrow one per request. Connections are opened
+    in WAL mode and keep their prepared-statement cache between calls.
+    """
+
+    def __init__(self, db_path: str, size: int = DB_POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.acquires = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open and configure a new connection."""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE,
+        )
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{int(DB_CACHE_SIZE_KB)}')
+        conn.execute(f'PRAGMA mmap_size = {int(DB_MMAP_SIZE)}')
+        conn.execute(f'PRAGMA busy_timeout = {int(DB_BUSY_TIMEOUT_MS)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        with self._lock:
+            self.connects += 1
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, borrowing one if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            self._local.conn = conn
+        with self._lock:
+            self.acquires += 1
+        return conn
+
+    def release(self):
+        """Give the calling thread's connection back to the pool."""
+        conn = self._local.__dict__.pop('conn', None)
+        if conn is None:
+            return
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() < self.size:
+            self._idle.put(conn)
+        else:
+            conn.close()
+
+    def close_all(self):
+        """Close every idle connection and the calling thread's one."""
+        self.release()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self) -> dict:
+        """Return connection counters for monitoring."""
+        return {
+            'connects': self.connects,
+            'acquires': self.acquires,
+            'idle': self._idle.qsize(),
+        }
+
+def _column_names(cursor, table: str) -> List[str]:
+    """Get the column names of a table."""
+    return [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+
+def _create_base_tables(cursor):
+    """Migration 1: users and referrals tables."""
+    # Create users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            referrer_id INTEGER,
+            referral_count INTEGER DEFAULT 0,
+            balance REAL DEFAULT 0.0,
+            wallet_address TEXT,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (referrer_id) REFERENCES users (user_id)
+        )
+    ''')
+    
+    # Create referrals table for tracking
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS referrals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            referrer_id INTEGER,
+            referred_id INTEGER,
+            reward_amount REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (referrer_id) REFERENCES users (user_id),
+            FOREIGN KEY (referred_id) REFERENCES users (user_id)
+        )
+    ''')
+
+def _add_start_tracking_columns(cursor):
+    """Migration 2: start_count/last_start columns written by /start."""
+    columns = _column_names(cursor, 'users')
+    if 'start_count' not in columns:
+        cursor.execute('ALTER TABLE users ADD COLUMN start_count INTEGER DEFAULT 1')
+    if 'last_start' not in columns:
+        cursor.execute('ALTER TABLE users ADD COLUMN last_start TIMESTAMP')
+
+def _create_stats_table(cursor):
+    """Migration 3: global counters, seeded from existing rows."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO stats (key, value)
+        SELECT 'total_starts', COALESCE(SUM(COALESCE(start_count, 1)), 0) FROM users
+    ''')
+
+def _create_broadcast_tables(cursor):
+    """Migration 4: durable broadcast jobs and the media file_id cache."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message TEXT NOT NULL,
+            announcement_type TEXT DEFAULT 'text',
+            image_path TEXT,
+            status TEXT DEFAULT 'queued',
+            total INTEGER DEFAULT 0,
+            sent INTEGER DEFAULT 0,
+            failed INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_deliveries (
+            job_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            error TEXT,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (job_id, user_id),
+            FOREIGN KEY (job_id) REFERENCES broadcast_jobs (id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS media_cache (
+            sha256 TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+
+def _add_lookup_indexes(cursor):
+    """Migration 5: indexes for admin queries and one referral per user."""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_referrer_id ON users (referrer_id, joined_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_joined_at ON users (joined_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_referrals_referrer_id ON referrals (referrer_id)')
+    
+    # Keep only the first referral recorded for each referred user
+    cursor.execute('''
+        DELETE FROM referrals
+        WHERE id NOT IN (SELECT MIN(id) FROM referrals GROUP BY referred_id)
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_referrals_referred_id ON referrals (referred_id)')
+
+def _add_user_listing_indexes(cursor):
+    """Migration 6: indexes backing the admin user list sorts and search."""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_balance ON users (balance)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_referral_count ON users (referral_count)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_username ON users (username COLLATE NOCASE)')
+
+def _add_export_indexes(cursor):
+    """Migration 7: timestamp index for incremental referral exports."""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_referrals_created_at ON referrals (created_at)')
+
+def _create_events_table(cursor):
+    """Migration 8: outbox of activity events tailed by the admin live feed."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event_type TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _create_activity_rollups(cursor):
+    """Migration 9: hourly and daily activity counters, backfilled from existing rows."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS activity_rollups (
+            granularity TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            new_users INTEGER NOT NULL DEFAULT 0,
+            referrals INTEGER NOT NULL DEFAULT 0,
+            starts INTEGER NOT NULL DEFAULT 0,
+            withdrawals INTEGER NOT NULL DEFAULT 0,
+            withdrawn REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (granularity, bucket)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Start and withdrawal history was never stored, so only joins and
+    # referrals can be backfilled; every join counts as its first start.
+    for granularity, bucket_format in ROLLUP_BUCKETS.items():
+        cursor.execute(f'''
+            INSERT OR IGNORE INTO activity_rollups (granularity, bucket, new_users, starts)
+            SELECT ?, strftime('{bucket_format}', joined_at), COUNT(*), COUNT(*)
+            FROM users WHERE joined_at IS NOT NULL
+            GROUP BY 2
+        ''', (granularity,))
+        cursor.execute(f'''
+            INSERT INTO activity_rollups (granularity, bucket, referrals)
+            SELECT ?, strftime('{bucket_format}', created_at), COUNT(*)
+            FROM referrals WHERE created_at IS NOT NULL
+            GROUP BY 2
+            ON CONFLICT (granularity, bucket) DO UPDATE SET referrals = excluded.referrals
+        ''', (granularity,))
+
+def _create_ledger(cursor):
+    """Migration 10: append-only ledger of balance and referral count changes."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount REAL NOT NULL DEFAULT 0,
+            referrals INTEGER NOT NULL DEFAULT 0,
+            reason TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ledger_user_id ON ledger (user_id, id)')
+    # Entries with id above this watermark are not yet folded into users
+    cursor.execute("INSERT OR IGNORE INTO stats (key, value) VALUES ('ledger_applied_id', 0)")
+
+def _add_broadcast_job_owner(cursor):
+    """Migration 11: owner and heartbeat of the process sending a broadcast job."""
+    columns = _column_names(cursor, 'broadcast_jobs')
+    if 'owner' not in columns:
+        cursor.execute('ALTER TABLE broadcast_jobs ADD COLUMN owner TEXT')
+    if 'heartbeat' not in columns:
+        cursor.execute('ALTER TABLE broadcast_jobs ADD COLUMN heartbeat REAL')
+
+def _add_null_safe_sort_indexes(cursor):
+    """Migration 12: expression indexes matching the NULL-safe user list sort keys."""
+    # Expressions must match USER_SORT_COLUMNS exactly for SQLite to use them
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_sort_joined_at ON users (COALESCE(joined_at, ''))")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_sort_balance ON users (COALESCE(balance, 0))')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_sort_referrals ON users (COALESCE(referral_count, 0))')
+    # Superseded by the expression indexes
+    cursor.execute('DROP INDEX IF EXISTS idx_users_balance')
+    cursor.execute('DROP INDEX IF EXISTS idx_users_referral_count')
+
+def _index_broadcast_job_created_at(cursor):
+    """Migration 13: index the broadcast job timestamp used by exports."""
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_broadcast_jobs_created_at ON broadcast_jobs (created_at)')
+
+# Schema migrations as (version, description, function), applied in order.
+# The applied version is stored in PRAGMA user_version. Every migration must
+# also be safe on databases created before versioning existed.
+MIGRATIONS = [
+    (1, "create users and referrals tables", _create_base_tables),
+    (2, "add start tracking columns", _add_start_tracking_columns),
+    (3, "create stats counters", _create_stats_table),
+    (4, "create broadcast and media cache tables", _create_broadcast_tables),
+    (5, "add lookup indexes and unique referred_id", _add_lookup_indexes),
+    (6, "add user listing indexes", _add_user_listing_indexes),
+    (7, "add export indexes", _add_export_indexes),
+    (8, "create events outbox", _create_events_table),
+    (9, "create activity rollups", _create_activity_rollups),
+    (10, "create balance ledger", _create_ledger),
+    (11, "add broadcast job owner and heartbeat", _add_broadcast_job_owner),
+    (12, "add NULL-safe user sort indexes", _add_null_safe_sort_indexes),
+    (13, "index broadcast job timestamps", _index_broadcast_job_created_at),
+]
+
+# Balance and referral count of user :user_id, including ledger entries that
+# apply_ledger has not folded into the users row yet
+EFFECTIVE_BALANCE_SQL = '''
+    SELECT users.balance + COALESCE(pending.amount, 0) AS balance,
+           users.referral_count + COALESCE(pending.referrals, 0) AS referral_count
+    FROM users, (SELECT SUM(amount) AS amount, SUM(referrals) AS referrals FROM ledger
+                 WHERE user_id = :user_id
+                   AND id > (SELECT value FROM stats WHERE key = 'ledger_applied_id')) AS pending
+    WHERE users.user_id = :user_id
+'''
+
+# Time buckets of activity_rollups: granularity -> strftime format of a UTC timestamp
+ROLLUP_BUCKETS = {
+    'hour': '%Y-%m-%d %H:00',
+    'day': '%Y-%m-%d',
+}
+
+# Counters kept per bucket in activity_rollups
+ROLLUP_METRICS = ('new_users', 'referrals', 'starts', 'withdrawals', 'withdrawn')
+
+# Tables that can be exported, with the indexed timestamp column used to
+# order rows and select "rows since" for incremental exports.
+EXPORT_TABLES = {
+    'users': 'joined_at',
+    'referrals': 'created_at',
+    'broadcast_jobs': 'created_at',
+}
+
+# Sort keys for the admin user list. NULLs are mapped to a fixed value so the
+# keyset comparison never meets a NULL and skips rows; each expression has a
+# matching index, and since user_id is the rowid every index is already
+# ordered by (expression, user_id).
+USER_SORT_COLUMNS = {
+    'joined_at': "COALESCE(joined_at, '')",
+    'balance': 'COALESCE(balance, 0)',
+    'referrals': 'COALESCE(referral_count, 0)',
+}
+
+# Marks a user-cache miss (None is a cached "not registered")
+_MISSING = object()
+
 class Database:
-    def __init__(self, db_path: str = "bot_users.db"):
+    def __init__(self, db_path: str = DATABASE_PATH):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path)
+        # (balance, referral_count) or None per user, invalidated by this
+        # process's writes; the TTL bounds staleness from other processes
+        self.user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+        self._user_cache_generation = 0
         self.init_database()
     
-    def get_connection(self):
-        """Get database connection."""
-        return sqlite3.connect(self.db_path)
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        Get the pooled database connection for the current thread.
+
+        The connection stays open; call release_connection() when a thread
+        (e.g. a Flask request) is done with it instead of closing it.
+        """
+        return self.pool.acquire()
+
+    def release_connection(self):
+        """Return the current thread's connection to the pool."""
+        self.pool.release()
     
     def init_database(self):
-        """Initialize the database with required tables."""
-        conn = sqlite3.connect(self.db_path)
+        """Initialize the database, bringing its schema up to date."""
+        version = self.migrate()
+        logger.info(f"Database initialized successfully (schema version {version})")
+    
+    def migrate(self) -> int:
+        """
+        Apply any pending schema migrations.
+
+        Each migration runs in its own IMMEDIATE transaction together with the
+        user_version bump, so a failed migration leaves the previous version
+        intact and the bot and admin processes never apply one twice.
+
+        Returns:
+            int: The schema version after migrating
+        """
+        conn = self.get_connection()
         cursor = conn.cursor()
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
         
-        # Create users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                full_name TEXT,
-                referrer_id INTEGER,
-                referral_count INTEGER DEFAULT 0,
-                balance REAL DEFAULT 0.0,
-                wallet_address TEXT,
-                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (referrer_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Create referrals table for tracking
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS referrals (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                referrer_id INTEGER,
-                referred_id INTEGER,
-                reward_amount REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (referrer_id) REFERENCES users (user_id),
-                FOREIGN KEY (referred_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
-        logger.info("Database initialized successfully")
+        for target, description, migration in MIGRATIONS:
+            if target <= version:
+                continue
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                version = cursor.execute('PRAGMA user_version').fetchone()[0]
+                if target <= version:
+                    conn.rollback()
+                    continue
+                migration(cursor)
+                cursor.execute(f'PRAGMA user_version = {target}')
+                conn.commit()
+                version = target
+                logger.info(f"Applied database migration {target}: {description}")
+            except sqlite3.Error as e:
+                conn.rollback()
+                logger.error(f"Database migration {target} ({description}) failed: {e}")
+                raise
+        return version
     
     def add_user(self, user_id: int, username: str, full_name: str, referrer_id: Optional[int] = None) -> bool:
         """Add a new user to the database."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
@@ -65,18 +428,23 @@ class Database:
             cursor.execute('SELECT user_id FROM users WHERE user_id = ?', (user_id,))
             if cursor.fetchone():
                 return False  # User already exists
+            referrer_id = self._valid_referrer(cursor, referrer_id, user_id)
             
             # Add new user with welcome bonus
             cursor.execute('''
                 INSERT INTO users (user_id, username, full_name, referrer_id, balance, start_count, last_start)
                 VALUES (?, ?, ?, ?, ?, 1, CURRENT_TIMESTAMP)
             ''', (user_id, username, full_name, referrer_id, WELCOME_BONUS))
+            self._publish_user_joined(cursor, user_id)
             
             # If this user was referred, add referral reward
             if referrer_id:
                 self._add_referral_reward(cursor, referrer_id, user_id)
             
+            self._increment_stat(cursor, 'total_starts')
+            self._bump_rollups(cursor, new_users=1, starts=1)
             conn.commit()
+            self.invalidate_users(user_id, referrer_id)
             logger.info(f"Added new user {user_id} with referrer {referrer_id}")
             return True
             
@@ -84,154 +452,575 @@ class Database:
             logger.error(f"Error adding user {user_id}: {e}")
             conn.rollback()
             return False
-        finally:
-            conn.close()
+    
+    def record_start(self, user_id: int, username: str, full_name: str,
+                     referrer_id: Optional[int] = None,
+                     register: bool = True) -> Tuple[int, bool, Optional[int]]:
+        """
+        Record a /start command in a single transaction.
+
+        With register=True the user is inserted if missing (with welcome bonus
+        and referral reward) or has their start count bumped if they already
+        exist, using one upsert. With register=False only existing users are
+        counted. A referrer ID that is not a registered user (or is the user
+        themselves) is ignored, so forged start payloads earn nothing.
+
+        Returns:
+            Tuple[int, bool, Optional[int]]: (user's start count, whether the
+                user was just added, referrer credited with the referral or None)
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            if register:
+                referrer_id = self._valid_referrer(cursor, referrer_id, user_id)
+
+                # Existing users without a recorded count already count as one start
+                cursor.execute('''
+                    INSERT INTO users (user_id, username, full_name, referrer_id, balance, start_count, last_start)
+                    VALUES (?, ?, ?, ?, ?, 1, CURRENT_TIMESTAMP)
+                    ON CONFLICT (user_id) DO UPDATE
+                    SET start_count = COALESCE(start_count, 1) + 1, last_start = CURRENT_TIMESTAMP
+                    RETURNING start_count
+                ''', (user_id, username, full_name, referrer_id, WELCOME_BONUS))
+            else:
+                cursor.execute('''
+                    UPDATE users
+                    SET start_count = COALESCE(start_count, 1) + 1, last_start = CURRENT_TIMESTAMP
+                    WHERE user_id = ?
+                    RETURNING start_count
+                ''', (user_id,))
+            result = cursor.fetchone()
+            if not result:
+                conn.rollback()
+                return 1, False, None  # Unregistered user, nothing recorded yet
+            
+            start_count = result[0]
+            is_new = register and start_count == 1
+            credited_referrer = referrer_id if is_new else None
+            if is_new:
+                self._publish_user_joined(cursor, user_id)
+            if credited_referrer:
+                self._add_referral_reward(cursor, credited_referrer, user_id)
+            
+            self._increment_stat(cursor, 'total_starts')
+            self._bump_rollups(cursor, new_users=int(is_new), starts=1)
+            conn.commit()
+            if is_new:
+                self.invalidate_users(user_id, referrer_id)
+                logger.info(f"Added new user {user_id} with referrer {referrer_id}")
+            return start_count, is_new, credited_referrer
+            
+        except sqlite3.Error as e:
+            logger.error(f"Error recording start for {user_id}: {e}")
+            conn.rollback()
+            return 1, False, None
+    
+    def _valid_referrer(self, cursor, referrer_id: Optional[int], user_id: int) -> Optional[int]:
+        """Return referrer_id if it names another registered user, else None (internal method)."""
+        if not referrer_id:
+            return None
+        if referrer_id != user_id:
+            cursor.execute('SELECT 1 FROM users WHERE user_id = ?', (referrer_id,))
+            if cursor.fetchone():
+                return referrer_id
+        logger.warning(f"Ignoring referral of {user_id} by unknown user {referrer_id}")
+        return None
     
     def _add_referral_reward(self, cursor, referrer_id: int, referred_id: int):
-        """Add referral reward to referrer (internal method)."""
-        # Update referrer's balance and count
+        """
+        Add referral reward to referrer (internal method).
+
+        The reward is appended to the ledger instead of updating the
+        referrer's row, so a popular referrer does not become a write
+        hotspot; apply_ledger folds it into the balance later.
+        """
         cursor.execute('''
-            UPDATE users 
-            SET balance = balance + ?, referral_count = referral_count + 1
-            WHERE user_id = ?
-        ''', (REFERRAL_REWARD, referrer_id))
+            INSERT INTO ledger (user_id, amount, referrals, reason)
+            VALUES (?, ?, 1, 'referral')
+        ''', (referrer_id, REFERRAL_REWARD))
         
         # Record the referral
         cursor.execute('''
             INSERT INTO referrals (referrer_id, referred_id, reward_amount)
             VALUES (?, ?, ?)
         ''', (referrer_id, referred_id, REFERRAL_REWARD))
+        self._bump_rollups(cursor, referrals=1)
         
-        # Send notification to referrer about the reward
-        self._send_referral_notification(referrer_id, referred_id)
+        # Publish to the admin live feed
+        cursor.execute(f'''
+            INSERT INTO events (event_type, payload)
+            SELECT 'referral', json_object('referrer_id', :user_id, 'referred_id', :referred_id,
+                                           'reward', :reward, 'balance', balance,
+                                           'referral_count', referral_count)
+            FROM ({EFFECTIVE_BALANCE_SQL})
+        ''', {'user_id': referrer_id, 'referred_id': referred_id, 'reward': REFERRAL_REWARD})
+    
+    def _publish_user_joined(self, cursor, user_id: int):
+        """Publish a user_joined event for a just-inserted user (internal method)."""
+        cursor.execute('''
+            INSERT INTO events (event_type, payload)
+            SELECT 'user_joined', json_object('user_id', user_id, 'username', username,
+                                              'full_name', full_name, 'balance', balance,
+                                              'joined_at', joined_at, 'referrer_id', referrer_id)
+            FROM users WHERE user_id = ?
+        ''', (user_id,))
     
-    def _send_referral_notification(self, referrer_id: int, referred_id: int):
-        """Send notification to referrer about new referral reward."""
+    def get_events(self, after_id: int = 0, limit: int = 500) -> List[Tuple[int, str, str]]:
+        """
+        Get activity events newer than an event ID.
+
+        Args:
+            after_id: Last event ID already seen
+            limit: Maximum number of events
+
+        Returns:
+            List[Tuple[int, str, str]]: (id, event type, JSON payload), oldest first
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
         try:
-            import requests
-            import os
-            import threading
+            cursor.execute('''
+                SELECT id, event_type, payload FROM events
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (after_id, limit))
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading events: {e}")
+            return []
+    
+    def get_last_event_id(self) -> int:
+        """Get the ID of the newest activity event."""
+        conn = self.get_connection()
+        result = conn.execute('SELECT MAX(id) FROM events').fetchone()
+        return result[0] or 0
+    
+    def prune_events(self, keep: int) -> int:
+        """Delete all but the newest `keep` activity events."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('DELETE FROM events WHERE id <= (SELECT MAX(id) FROM events) - ?', (keep,))
+            conn.commit()
+            return cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Error pruning events: {e}")
+            conn.rollback()
+            return 0
+    
+    def data_version(self) -> int:
+        """
+        Get this thread's connection data version.
+
+        The value changes whenever another connection (including other
+        processes) commits, so pollers can skip queries while it is unchanged.
+        """
+        return self.get_connection().execute('PRAGMA data_version').fetchone()[0]
+    
+    def get_dashboard_stats(self, recent_limit: int = 50) -> Optional[dict]:
+        """
+        Collect the admin dashboard aggregates.
+
+        All user totals come from one pass over the users table; the
+        joined-today and last-24h counts are read from activity_rollups.
+        Everything is read in one transaction together with the newest event
+        ID, so live feed clients can continue from exactly this state.
+
+        Args:
+            recent_limit: Number of most recently joined users to include
+
+        Returns:
+            Optional[dict]: Aggregates and recent users, or None on error
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('BEGIN')
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM events')
+            last_event_id = cursor.fetchone()[0]
             
-            def send_notification():
-                try:
-                    bot_token = os.getenv('BOT_TOKEN')
-                    if not bot_token:
-                        logger.error("BOT_TOKEN not found for notification")
-                        return
-                    
-                    # Get referrer's current balance and referral count
-                    conn = self.get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT balance, referral_count FROM users WHERE user_id = ?', (referrer_id,))
-                    result = cursor.fetchone()
-                    conn.close()
-                    
-                    if result:
-                        balance, referral_count = result
-                        
-                        message = f"""🎉 <b>New Referral Reward!</b> 🎉
-
-💰 You earned <b>+{REFERRAL_REWARD} USDT</b> for a successful referral!
-👤 New user ID: <code>{referred_id}</code>
-
-📊 <b>Your Stats:</b>
-💵 Current Balance: <b>{balance:.2f} USDT</b>
-👥 Total Referrals: <b>{referral_count}</b>
-
-Keep sharing your referral link to earn more! 🚀"""
-
-                        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-                        data = {
-                            'chat_id': referrer_id,
-                            'text': message,
-                            'parse_mode': 'HTML'
-                        }
-                        
-                        response = requests.post(url, data=data, timeout=10)
-                        if response.status_code == 200:
-                            logger.info(f"Referral notification sent to user {referrer_id}")
-                        else:
-                            logger.error(f"Failed to send referral notification to user {referrer_id}: {response.text}")
-                            
-                except Exception as e:
-                    logger.error(f"Error in notification thread: {e}")
+            cursor.execute('''
+                SELECT COUNT(*), COALESCE(SUM(balance), 0), COUNT(referrer_id),
+                       COUNT(CASE WHEN balance > 0 THEN 1 END),
+                       COALESCE(AVG(CASE WHEN balance > 0 THEN balance END), 0)
+                FROM users
+            ''')
+            total_users, total_balance, total_referrals, users_with_balance, avg_balance = cursor.fetchone()
             
-            # Send notification in background thread to avoid blocking
-            thread = threading.Thread(target=send_notification)
-            thread.daemon = True
-            thread.start()
+            # The last 24 hourly buckets: the current hour plus the 23 before it
+            cursor.execute(f'''
+                SELECT COALESCE(SUM(CASE WHEN granularity = 'day' THEN new_users END), 0),
+                       COALESCE(SUM(CASE WHEN granularity = 'hour' THEN new_users END), 0)
+                FROM activity_rollups
+                WHERE (granularity = 'day' AND bucket = strftime('{ROLLUP_BUCKETS['day']}', 'now'))
+                   OR (granularity = 'hour' AND bucket >= strftime('{ROLLUP_BUCKETS['hour']}', 'now', '-23 hours'))
+            ''')
+            today_users, active_users = cursor.fetchone()
             
-        except Exception as e:
-            logger.error(f"Error setting up referral notification: {e}")
+            cursor.execute('''
+                SELECT user_id, username, full_name, balance, joined_at, referrer_id
+                FROM users
+                ORDER BY joined_at DESC
+                LIMIT ?
+            ''', (recent_limit,))
+            recent_users = cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error collecting dashboard stats: {e}")
+            return None
+        finally:
+            conn.rollback()
+        
+        return {
+            'total_users': total_users,
+            'total_balance': total_balance,
+            'total_referrals': total_referrals,
+            'users_with_balance': users_with_balance,
+            'avg_balance': avg_balance,
+            'today_users': today_users,
+            'active_users': active_users,
+            'recent_users': recent_users,
+            'last_event_id': last_event_id,
+        }
     
-    def get_user_stats(self, user_id: int) -> Tuple[float, int]:
-        """Get user's balance and referral count."""
-        conn = sqlite3.connect(self.db_path)
+    def list_users(self, sort: str = 'joined_at', after: Optional[tuple] = None,
+                   search: Optional[str] = None, limit: int = 50) -> Tuple[List[tuple], Optional[tuple]]:
+        """
+        Get one page of users for the admin list, newest/largest first.
+
+        Pages are keyset-paginated on (sort column, user_id): pass the cursor
+        returned with one page as `after` to get the next one.
+
+        Args:
+            sort: Key of USER_SORT_COLUMNS
+            after: Cursor returned by the previous page
+            search: Exact user ID, or username prefix (case-insensitive)
+            limit: Page size
+
+        Returns:
+            Tuple[List[tuple], Optional[tuple]]: (rows, cursor for the next page or None)
+        """
+        column = USER_SORT_COLUMNS.get(sort, USER_SORT_COLUMNS['joined_at'])
+        conditions, params = [], []
+        if search:
+            search = search.strip().lstrip('@')
+            if search.isdigit():
+                conditions.append('user_id = ?')
+                params.append(int(search))
+            else:
+                escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                conditions.append("username LIKE ? ESCAPE '\\'")
+                params.append(escaped + '%')
+        if after:
+            conditions.append(f'({column}, user_id) < (?, ?)')
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
+            cursor.execute(f'''
+                SELECT user_id, username, full_name, balance, referral_count,
+                       joined_at, wallet_address, {column}
+                FROM users {where}
+                ORDER BY {column} DESC, user_id DESC
+                LIMIT ?
+            ''', (*params, limit + 1))
+            rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Error listing users: {e}")
+            return [], None
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1][-1], rows[-1][0])
+        return [row[:-1] for row in rows], next_cursor
+    
+    def iter_export(self, table: str, since: Optional[str] = None,
+                    chunk_size: int = 1000) -> Tuple[List[str], Iterator[List[tuple]]]:
+        """
+        Stream a table's rows in chunks for export.
+
+        Rows are read from a server-side cursor ordered by the table's
+        timestamp column, so memory stays bounded by one chunk.
+
+        Args:
+            table: Key of EXPORT_TABLES
+            since: Only rows with a timestamp after this ('YYYY-MM-DD HH:MM:SS')
+            chunk_size: Rows per chunk
+
+        Returns:
+            Tuple[List[str], Iterator[List[tuple]]]: (column names, chunks of rows)
+        """
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Table {table} cannot be exported")
+        column = EXPORT_TABLES[table]
+        where, params = '', ()
+        if since:
+            where, params = f'WHERE {column} > ?', (since,)
+        
+        cursor = self.get_connection().cursor()
+        cursor.execute(f'SELECT * FROM {table} {where} ORDER BY {column}', params)
+        columns = [description[0] for description in cursor.description]
+        
+        def chunks():
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
+        
+        return columns, chunks()
+    
+    def reconcile_referral_counts(self) -> int:
+        """
+        Repair drift between users.referral_count and the referrals table.
+
+        Counts are recomputed in bulk with one grouped scan of the referrals
+        index, and only rows whose stored count differs are rewritten. The
+        ledger is folded first in the same transaction, so referrals whose
+        count increment is still pending are not counted twice.
+
+        Returns:
+            int: Number of users whose count was corrected
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            self._apply_ledger(cursor)
             cursor.execute('''
-                SELECT balance, referral_count FROM users WHERE user_id = ?
-            ''', (user_id,))
+                UPDATE users SET referral_count = counts.n
+                FROM (SELECT referrer_id, COUNT(*) AS n FROM referrals GROUP BY referrer_id) AS counts
+                WHERE users.user_id = counts.referrer_id AND users.referral_count IS NOT counts.n
+            ''')
+            fixed = cursor.rowcount
+            cursor.execute('''
+                UPDATE users SET referral_count = 0
+                WHERE referral_count IS NOT 0
+                  AND NOT EXISTS (SELECT 1 FROM referrals r WHERE r.referrer_id = users.user_id)
+            ''')
+            fixed += cursor.rowcount
+            conn.commit()
+            if fixed:
+                self.invalidate_users()
+                logger.warning(f"Reconciled referral counts for {fixed} users")
+            return fixed
+        except sqlite3.Error as e:
+            logger.error(f"Error reconciling referral counts: {e}")
+            conn.rollback()
+            return 0
+    
+    def _apply_ledger(self, cursor, limit: Optional[int] = None) -> int:
+        """
+        Fold unapplied ledger entries into users in the caller's transaction (internal method).
+
+        The caller must hold the write lock (BEGIN IMMEDIATE) so no entry
+        below the new watermark can still be uncommitted.
+
+        Returns:
+            int: Number of entries applied
+        """
+        applied_id = cursor.execute("SELECT value FROM stats WHERE key = 'ledger_applied_id'").fetchone()[0]
+        cursor.execute('''
+            SELECT MAX(id), COUNT(*) FROM (SELECT id FROM ledger WHERE id > ? ORDER BY id LIMIT ?)
+        ''', (applied_id, -1 if limit is None else limit))
+        upto_id, entries = cursor.fetchone()
+        if not entries:
+            return 0
+        
+        cursor.execute('''
+            UPDATE users
+            SET balance = balance + totals.amount, referral_count = referral_count + totals.referrals
+            FROM (SELECT user_id, SUM(amount) AS amount, SUM(referrals) AS referrals
+                  FROM ledger WHERE id > ? AND id <= ? GROUP BY user_id) AS totals
+            WHERE users.user_id = totals.user_id
+        ''', (applied_id, upto_id))
+        cursor.execute("UPDATE stats SET value = ? WHERE key = 'ledger_applied_id'", (upto_id,))
+        return entries
+    
+    def apply_ledger(self, batch_size: int = LEDGER_APPLY_BATCH) -> int:
+        """
+        Fold up to batch_size pending ledger entries into user balances.
+
+        One grouped UPDATE per batch replaces one row update per referral.
+
+        Returns:
+            int: Number of entries applied
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            applied = self._apply_ledger(cursor, batch_size)
+            conn.commit()
+            return applied
+        except sqlite3.Error as e:
+            logger.error(f"Error applying ledger: {e}")
+            conn.rollback()
+            return 0
+    
+    def get_user_stats(self, user_id: int) -> Tuple[float, int]:
+        """Get user's balance and referral count, including unapplied ledger entries."""
+        record = self.get_user_record(user_id)
+        return record if record is not None else (0.0, 0)
+    
+    def cached_user_record(self, user_id: int):
+        """Get a user's record from the cache only, or _MISSING on a cache miss."""
+        return self.user_cache.get(user_id, _MISSING)
+    
+    def get_user_record(self, user_id: int) -> Optional[Tuple[float, int]]:
+        """Get user's balance and referral count, or None if not registered."""
+        record = self.cached_user_record(user_id)
+        if record is not _MISSING:
+            return record
+        generation = self._user_cache_generation
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(EFFECTIVE_BALANCE_SQL, {'user_id': user_id})
             result = cursor.fetchone()
-            if result:
-                return (float(result[0]), int(result[1]))
-            else:
-                return (0.0, 0)
         except sqlite3.Error as e:
-            logger.error(f"Error getting user stats for {user_id}: {e}")
-            return (0.0, 0)
-        finally:
-            conn.close()
+            logger.error(f"Error getting user record for {user_id}: {e}")
+            return None
+        
+        record = (float(result[0]), int(result[1])) if result else None
+        # Skip caching if a write invalidated users while this read ran
+        if generation == self._user_cache_generation:
+            self.user_cache.set(user_id, record)
+        return record
     
+    def invalidate_users(self, *user_ids: Optional[int]):
+        """Drop users from the record cache after a write; no IDs clears it."""
+        self._user_cache_generation += 1
+        if not user_ids:
+            self.user_cache.clear()
+        for user_id in user_ids:
+            if user_id is not None:
+                self.user_cache.invalidate(user_id)
+
     def update_start_count(self, user_id: int) -> int:
         """Update and return the start command count for a user."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            # Check if user exists and get current start_count
-            cursor.execute('SELECT start_count FROM users WHERE user_id = ?', (user_id,))
+            # Users without a recorded count are counted as one start already
+            cursor.execute('''
+                UPDATE users 
+                SET start_count = COALESCE(start_count, 1) + 1, last_start = CURRENT_TIMESTAMP 
+                WHERE user_id = ?
+                RETURNING start_count
+            ''', (user_id,))
             result = cursor.fetchone()
             
             if result:
-                # User exists, increment start count
-                current_count = result[0] if result[0] is not None else 0
-                new_count = current_count + 1
-                cursor.execute('''
-                    UPDATE users 
-                    SET start_count = ?, last_start = CURRENT_TIMESTAMP 
-                    WHERE user_id = ?
-                ''', (new_count, user_id))
+                self._increment_stat(cursor, 'total_starts')
+                self._bump_rollups(cursor, starts=1)
                 conn.commit()
-                return new_count
+                return result[0]
             else:
+                conn.rollback()
                 return 1  # New user will have count 1
                 
         except sqlite3.Error as e:
             logger.error(f"Error updating start count for {user_id}: {e}")
+            conn.rollback()
             return 1
-        finally:
-            conn.close()
     
-    def get_total_start_requests(self) -> int:
-        """Get total number of start requests across all users."""
-        conn = sqlite3.connect(self.db_path)
+    def _increment_stat(self, cursor, key: str, amount: int = 1):
+        """Add to a global counter in the caller's transaction (internal method)."""
+        cursor.execute('''
+            INSERT INTO stats (key, value) VALUES (?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = value + excluded.value
+        ''', (key, amount))
+    
+    def _bump_rollups(self, cursor, new_users: int = 0, referrals: int = 0, starts: int = 0,
+                      withdrawals: int = 0, withdrawn: float = 0.0):
+        """Add to the current hour and day activity buckets in the caller's transaction (internal method)."""
+        counts = (new_users, referrals, starts, withdrawals, withdrawn)
+        cursor.execute(f'''
+            INSERT INTO activity_rollups (granularity, bucket, {', '.join(ROLLUP_METRICS)})
+            VALUES ('hour', strftime('{ROLLUP_BUCKETS['hour']}', 'now'), ?, ?, ?, ?, ?),
+                   ('day', strftime('{ROLLUP_BUCKETS['day']}', 'now'), ?, ?, ?, ?, ?)
+            ON CONFLICT (granularity, bucket) DO UPDATE SET
+                {', '.join(f'{metric} = {metric} + excluded.{metric}' for metric in ROLLUP_METRICS)}
+        ''', counts * 2)
+    
+    def get_activity_series(self, granularity: str, points: int) -> List[dict]:
+        """
+        Get activity counters for the latest time buckets.
+
+        Reads at most `points` rows from activity_rollups, so the cost does
+        not depend on the size of the users or referrals tables. Buckets
+        without activity are filled with zeros.
+
+        Args:
+            granularity: Key of ROLLUP_BUCKETS ('hour' or 'day')
+            points: Number of buckets, ending with the current one
+
+        Returns:
+            List[dict]: One dict per bucket, oldest first
+        """
+        if granularity not in ROLLUP_BUCKETS:
+            raise ValueError(f"Unknown granularity {granularity}")
+        now = datetime.now(timezone.utc)
+        if granularity == 'hour':
+            step = timedelta(hours=1)
+            now = now.replace(minute=0, second=0, microsecond=0)
+        else:
+            step = timedelta(days=1)
+        bucket_format = ROLLUP_BUCKETS[granularity]
+        buckets = [(now - step * offset).strftime(bucket_format) for offset in range(points - 1, -1, -1)]
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(f'''
+                SELECT bucket, {', '.join(ROLLUP_METRICS)} FROM activity_rollups
+                WHERE granularity = ? AND bucket >= ?
+            ''', (granularity, buckets[0]))
+            rows = {row[0]: row[1:] for row in cursor.fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"Error reading {granularity} activity: {e}")
+            rows = {}
+        
+        empty = (0,) * len(ROLLUP_METRICS)
+        return [dict(zip(('bucket',) + ROLLUP_METRICS, (bucket,) + rows.get(bucket, empty))) for bucket in buckets]
+    
+    def get_stat(self, key: str) -> int:
+        """Get a global counter maintained in the stats table."""
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('SELECT SUM(COALESCE(start_count, 1)) FROM users')
+            cursor.execute('SELECT value FROM stats WHERE key = ?', (key,))
             result = cursor.fetchone()
-            return result[0] if result[0] else 0
+            return result[0] if result else 0
         except sqlite3.Error as e:
-            logger.error(f"Error getting total start requests: {e}")
+            logger.error(f"Error getting stat {key}: {e}")
             return 0
-        finally:
-            conn.close()
+    
+    def get_total_start_requests(self) -> int:
+        """Get total number of start requests across all users."""
+        return self.get_stat('total_starts')
     
     def update_wallet(self, user_id: int, wallet_address: str) -> bool:
         """Update user's wallet address."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
@@ -242,27 +1031,390 @@ Keep sharing your referral link to earn more! 🚀"""
             return cursor.rowcount > 0
         except sqlite3.Error as e:
             logger.error(f"Error updating wallet for {user_id}: {e}")
+            conn.rollback()
             return False
-        finally:
-            conn.close()
     
     def deduct_balance(self, user_id: int, amount: float) -> bool:
-        """Deduct amount from user's balance for withdrawal."""
-        conn = sqlite3.connect(self.db_path)
+        """Deduct amount from user's balance for withdrawal, after applying pending ledger entries."""
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
+            cursor.execute('BEGIN IMMEDIATE')
+            self._apply_ledger(cursor)
             cursor.execute('''
                 UPDATE users SET balance = balance - ? 
                 WHERE user_id = ? AND balance >= ?
             ''', (amount, user_id, amount))
+            deducted = cursor.rowcount > 0
+            if deducted:
+                self._bump_rollups(cursor, withdrawals=1, withdrawn=amount)
             conn.commit()
-            return cursor.rowcount > 0
+            self.invalidate_users(user_id)
+            return deducted
         except sqlite3.Error as e:
             logger.error(f"Error deducting balance for {user_id}: {e}")
+            conn.rollback()
             return False
-        finally:
-            conn.close()
 
-# Global database instance
-db = Database()
\ No newline at end of file
+    def iter_user_ids(self, batch_size: int = 1000) -> Iterator[int]:
+        """Stream every user ID from a cursor without loading them all at once."""
+        cursor = self.get_connection().cursor()
+        cursor.execute('SELECT user_id FROM users ORDER BY user_id')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row[0]
+
+    def create_broadcast_job(self, message: str, announcement_type: str = 'text',
+                             image_path: Optional[str] = None) -> Optional[int]:
+        """Create a queued broadcast job addressed to every current user."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                INSERT INTO broadcast_jobs (message, announcement_type, image_path, total)
+                VALUES (?, ?, ?, (SELECT COUNT(*) FROM users))
+            ''', (message, announcement_type, image_path))
+            conn.commit()
+            return cursor.lastrowid
+        except sqlite3.Error as e:
+            logger.error(f"Error creating broadcast job: {e}")
+            conn.rollback()
+            return None
+
+    def get_broadcast_job(self, job_id: int) -> Optional[dict]:
+        """Get a broadcast job with its progress and throughput."""
+        jobs = self._query_broadcast_jobs('WHERE id = ?', (job_id,))
+        return jobs[0] if jobs else None
+
+    def list_broadcast_jobs(self, limit: int = 20) -> List[dict]:
+        """Get the most recent broadcast jobs, newest first."""
+        return self._query_broadcast_jobs('ORDER BY id DESC LIMIT ?', (limit,))
+
+    def get_unfinished_broadcast_jobs(self, stale_before: float) -> List[int]:
+        """
+        Get IDs of jobs that were queued or interrupted mid-run.
+
+        Jobs whose owner sent a heartbeat at or after `stale_before` (a Unix
+        time) are still being sent by another process and are left out.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                SELECT id FROM broadcast_jobs
+                WHERE status IN ('queued', 'running') AND (owner IS NULL OR heartbeat < ?)
+                ORDER BY id
+            ''', (stale_before,))
+            return [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Error getting unfinished broadcast jobs: {e}")
+            return []
+
+    def claim_broadcast_job(self, job_id: int, owner: str, now: float, stale_before: float) -> bool:
+        """
+        Take ownership of an unfinished job so only one process sends it.
+
+        The claim succeeds if the job has no owner, already belongs to
+        `owner`, or its owner's last heartbeat is older than `stale_before`.
+
+        Args:
+            job_id: Broadcast job ID
+            owner: Identifier of the claiming process
+            now: Current Unix time, stored as the first heartbeat
+            stale_before: Unix time before which a heartbeat counts as dead
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                UPDATE broadcast_jobs SET owner = ?, heartbeat = ?
+                WHERE id = ? AND status != 'done'
+                  AND (owner IS NULL OR owner = ? OR heartbeat < ?)
+            ''', (owner, now, job_id, owner, stale_before))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Error claiming broadcast job {job_id}: {e}")
+            conn.rollback()
+            return False
+
+    def heartbeat_broadcast_job(self, job_id: int, owner: str, now: float) -> bool:
+        """Refresh the owner's heartbeat; False if the job was taken over meanwhile."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                UPDATE broadcast_jobs SET heartbeat = ? WHERE id = ? AND owner = ?
+            ''', (now, job_id, owner))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Error updating heartbeat of broadcast job {job_id}: {e}")
+            conn.rollback()
+            return False
+
+    def release_broadcast_job(self, job_id: int, owner: str) -> bool:
+        """Give up ownership of a job, if `owner` still holds it."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                UPDATE broadcast_jobs SET owner = NULL, heartbeat = NULL WHERE id = ? AND owner = ?
+            ''', (job_id, owner))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Error releasing broadcast job {job_id}: {e}")
+            conn.rollback()
+            return False
+
+    def _query_broadcast_jobs(self, clause: str, params: tuple) -> List[dict]:
+        """Select broadcast jobs as dicts (internal method)."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute(f'''
+                SELECT id, message, announcement_type, image_path, status, total, sent, failed,
+                       created_at, started_at, finished_at,
+                       (julianday(COALESCE(finished_at, CURRENT_TIMESTAMP)) - julianday(started_at)) * 86400
+                FROM broadcast_jobs {clause}
+            ''', params)
+            columns = [description[0] for description in cursor.description[:-1]]
+            jobs = []
+            for row in cursor.fetchall():
+                job = dict(zip(columns, row))
+                elapsed = row[-1] or 0
+                job['elapsed_seconds'] = round(elapsed, 1)
+                job['throughput'] = round((job['sent'] + job['failed']) / elapsed, 2) if elapsed > 0 else 0.0
+                jobs.append(job)
+            return jobs
+        except sqlite3.Error as e:
+            logger.error(f"Error querying broadcast jobs: {e}")
+            return []
+
+    def set_broadcast_job_status(self, job_id: int, status: str) -> bool:
+        """Update a job's status, stamping when it started and finished."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                UPDATE broadcast_jobs
+                SET status = ?,
+                    started_at = CASE WHEN ? = 'running' THEN COALESCE(started_at, CURRENT_TIMESTAMP) ELSE started_at END,
+                    finished_at = CASE WHEN ? IN ('done', 'failed') THEN CURRENT_TIMESTAMP ELSE NULL END
+                WHERE id = ?
+            ''', (status, status, status, job_id))
+            conn.commit()
+            return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            logger.error(f"Error updating broadcast job {job_id}: {e}")
+            conn.rollback()
+            return False
+
+    def get_broadcast_recipients(self, job_id: int, after_user_id: int, limit: int) -> List[int]:
+        """
+        Get the next batch of users that have not been sent this job yet.
+
+        Users are walked in user_id order starting after `after_user_id`, so
+        callers can page through the whole audience. Users who joined after
+        the job was created are left out.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                SELECT u.user_id FROM users u
+                WHERE u.user_id > ?
+                  AND u.joined_at <= (SELECT created_at FROM broadcast_jobs WHERE id = ?)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM broadcast_deliveries d
+                      WHERE d.job_id = ? AND d.user_id = u.user_id
+                  )
+                ORDER BY u.user_id
+                LIMIT ?
+            ''', (after_user_id, job_id, job_id, limit))
+            return [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error(f"Error getting recipients for broadcast job {job_id}: {e}")
+            return []
+
+    def record_broadcast_deliveries(self, job_id: int, deliveries: List[Tuple[int, str, Optional[str]]]) -> bool:
+        """
+        Checkpoint a batch of delivery results in one transaction.
+
+        Args:
+            job_id: Broadcast job ID
+            deliveries: (user_id, 'sent' or 'failed', error) tuples
+        """
+        if not deliveries:
+            return True
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            counts = {'sent': 0, 'failed': 0}
+            for status in counts:
+                rows = [(job_id, user_id, s, error) for user_id, s, error in deliveries if s == status]
+                if rows:
+                    cursor.executemany('''
+                        INSERT OR IGNORE INTO broadcast_deliveries (job_id, user_id, status, error)
+                        VALUES (?, ?, ?, ?)
+                    ''', rows)
+                    counts[status] = cursor.rowcount
+            cursor.execute('''
+                UPDATE broadcast_jobs SET sent = sent + ?, failed = failed + ? WHERE id = ?
+            ''', (counts['sent'], counts['failed'], job_id))
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error recording deliveries for broadcast job {job_id}: {e}")
+            conn.rollback()
+            return False
+
+    def get_media_file_id(self, sha256: str) -> Optional[str]:
+        """Get the Telegram file_id previously returned for a file's content."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('SELECT file_id FROM media_cache WHERE sha256 = ?', (sha256,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+        except sqlite3.Error as e:
+            logger.error(f"Error reading media cache: {e}")
+            return None
+
+    def cache_media_file_id(self, sha256: str, file_id: str) -> bool:
+        """Remember the Telegram file_id for a file's content."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                INSERT OR REPLACE INTO media_cache (sha256, file_id) VALUES (?, ?)
+            ''', (sha256, file_id))
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error writing media cache: {e}")
+            conn.rollback()
+            return False
+
+class AsyncDatabase:
+    """
+    Awaitable counterpart to Database for use from the bot's event loop.
+
+    Writes are queued onto a single dedicated writer thread so they never
+    contend with each other for the SQLite write lock; reads run on a small
+    pool of reader threads, which WAL mode lets proceed alongside the writer.
+    Each worker thread keeps its own pooled connection.
+    """
+
+    def __init__(self, database: Database, readers: int = DB_READER_THREADS):
+        self.db = database
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+    
+    async def _write(self, func, *args):
+        """Run a write operation on the writer thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, functools.partial(func, *args))
+    
+    async def _read(self, func, *args):
+        """Run a read operation on a reader thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, functools.partial(func, *args))
+    
+    async def add_user(self, user_id: int, username: str, full_name: str, referrer_id: Optional[int] = None) -> bool:
+        """Add a new user to the database."""
+        return await self._write(self.db.add_user, user_id, username, full_name, referrer_id)
+    
+    async def record_start(self, user_id: int, username: str, full_name: str,
+                           referrer_id: Optional[int] = None,
+                           register: bool = True) -> Tuple[int, bool, Optional[int]]:
+        """Record a /start command in a single transaction."""
+        return await self._write(self.db.record_start, user_id, username, full_name, referrer_id, register)
+    
+    async def get_user_stats(self, user_id: int) -> Tuple[float, int]:
+        """Get user's balance and referral count."""
+        record = await self.get_user_record(user_id)
+        return record if record is not None else (0.0, 0)
+    
+    async def get_user_record(self, user_id: int) -> Optional[Tuple[float, int]]:
+        """Get user's balance and referral count, or None if not registered."""
+        # Cache hits are answered on the event loop without a thread hop
+        record = self.db.cached_user_record(user_id)
+        if record is not _MISSING:
+            return record
+        return await self._read(self.db.get_user_record, user_id)
+    
+    async def update_start_count(self, user_id: int) -> int:
+        """Update and return the start command count for a user."""
+        return await self._write(self.db.update_start_count, user_id)
+    
+    async def get_total_start_requests(self) -> int:
+        """Get total number of start requests across all users."""
+        return await self._read(self.db.get_total_start_requests)
+    
+    async def update_wallet(self, user_id: int, wallet_address: str) -> bool:
+        """Update user's wallet address."""
+        return await self._write(self.db.update_wallet, user_id, wallet_address)
+    
+    async def deduct_balance(self, user_id: int, amount: float) -> bool:
+        """Deduct amount from user's balance for withdrawal."""
+        return await self._write(self.db.deduct_balance, user_id, amount)
+    
+    async def apply_ledger(self, batch_size: int = LEDGER_APPLY_BATCH) -> int:
+        """Fold up to batch_size pending ledger entries into user balances."""
+        return await self._write(self.db.apply_ledger, batch_size)
+    
+    async def prune_events(self, keep: int = EVENT_RETENTION) -> int:
+        """Delete all but the newest `keep` activity events."""
+        return await self._write(self.db.prune_events, keep)
+    
+    async def run_maintenance(self, interval: float = LEDGER_APPLY_INTERVAL,
+                              prune_interval: float = EVENT_PRUNE_INTERVAL, retention: int = EVENT_RETENTION):
+        """
+        Run the bot's periodic database upkeep.
+
+        The ledger is applied every interval seconds, draining backlogs batch
+        by batch. Every prune_interval seconds the events outbox is trimmed
+        to the newest `retention` events. This runs in the bot, which appends
+        the events, so the table stays bounded whether or not anyone watches
+        the admin live feed.
+        """
+        loop = asyncio.get_running_loop()
+        next_prune = loop.time()
+        while True:
+            try:
+                while await self.apply_ledger() >= LEDGER_APPLY_BATCH:
+                    pass
+                if loop.time() >= next_prune:
+                    next_prune = loop.time() + prune_interval
+                    pruned = await self.prune_events(retention)
+                    if pruned:
+                        logger.info(f"Pruned {pruned} old activity events")
+            except Exception as e:
+                logger.error(f"Database maintenance error: {e}")
+            await asyncio.sleep(interval)
+    
+    def close(self):
+        """Stop the worker threads after pending operations finish."""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+# Global database instances
+db = Database()
+adb = AsyncDatabase(db)
\ No newline at end of file
@@ -0,0 +1,147 @@
+"""
+Live activity event bus for the admin panel.
+
+The bot runs in a separate process, so its write paths append events to the
+`events` table in the same transaction as the change. One tailer thread in
+the admin process watches `PRAGMA data_version`, which changes only when
+another connection commits, reads new events only then, and fans them out
+to every subscribed /api/stream client.
+"""
+
+import json
+import logging
+import queue
+import threading
+import time
+from typing import List, Optional
+
+from config import (
+    EVENT_POLL_INTERVAL, EVENT_SUBSCRIBER_QUEUE,
+)
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+# Events read from the database per query
+FETCH_SIZE = 500
+
+class Event:
+    """One activity event, formatted for Server-Sent Events."""
+
+    __slots__ = ('id', 'type', 'payload')
+
+    def __init__(self, event_id: int, event_type: str, payload: str):
+        self.id = event_id
+        self.type = event_type
+        self.payload = payload
+
+    def to_sse(self) -> str:
+        """Format as an SSE message with id, event name and JSON data."""
+        return f"id: {self.id}\nevent: {self.type}\ndata: {self.payload}\n\n"
+
+class Subscription:
+    """Bounded event queue of one stream client."""
+
+    def __init__(self, maxsize: int = EVENT_SUBSCRIBER_QUEUE):
+        self.queue: "queue.Queue[Event]" = queue.Queue(maxsize)
+        self.closed = False
+
+    def get(self, timeout: float) -> Optional[Event]:
+        """Wait for the next event; None on timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class EventBus:
+    """Fans events out to subscribers; tails the database while anyone listens."""
+
+    def __init__(self, database: Database = db, poll_interval: float = EVENT_POLL_INTERVAL):
+        self.database = database
+        self.poll_interval = poll_interval
+        self._subscribers: List[Subscription] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.last_id = 0
+
+    def subscribe(self) -> Subscription:
+        """Register a stream client, starting the tailer if needed."""
+        subscription = Subscription()
+        with self._lock:
+            self._subscribers.append(subscription)
+            if self._thread is None or not self._thread.is_alive():
+                self.last_id = self.database.get_last_event_id()
+                self._thread = threading.Thread(target=self._tail, name="event-tailer", daemon=True)
+                self._thread.start()
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """Remove a stream client."""
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+        subscription.closed = True
+
+    def publish(self, event: Event):
+        """
+        Deliver an event to every subscriber.
+
+        A client that falls EVENT_SUBSCRIBER_QUEUE events behind is closed
+        rather than buffered without bound; its browser reconnects with
+        Last-Event-ID and catches up from the events table.
+        """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                logger.warning("Live feed client fell behind, disconnecting it")
+                self.unsubscribe(subscription)
+
+    def replay(self, after_id: int, limit: int = EVENT_SUBSCRIBER_QUEUE) -> List[Event]:
+        """Get stored events after after_id, for clients resuming a stream."""
+        return [Event(*row) for row in self.database.get_events(after_id, limit)]
+
+    def _tail(self):
+        """Publish new events from the database until nobody is subscribed."""
+        data_version = None
+        try:
+            while True:
+                with self._lock:
+                    if not self._subscribers:
+                        self._thread = None
+                        return
+
+                version = self.database.data_version()
+                if version != data_version:
+                    data_version = version
+                    while True:
+                        rows = self.database.get_events(self.last_id, FETCH_SIZE)
+                        for row in rows:
+                            self.last_id = row[0]
+                            self.publish(Event(*row))
+                        if len(rows) < FETCH_SIZE:
+                            break
+
+                time.sleep(self.poll_interval)
+        except Exception as e:
+            logger.error(f"Event tailer error: {e}")
+            with self._lock:
+                self._thread = None
+        finally:
+            self.database.release_connection()
+
+def parse_event_id(value: Optional[str]) -> Optional[int]:
+    """Parse a Last-Event-ID header value."""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+def snapshot_event(payload: dict) -> str:
+    """Format the initial state sent to a new stream client."""
+    return f"event: snapshot\ndata: {json.dumps(payload)}\n\n"
+
+# Global event bus instance
+event_bus = EventBus()
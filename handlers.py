@@ -2,17 +2,61 @@
 Message and callback handlers for the Telegram bot.
 """
 
+import functools
 import logging
 from aiogram import types, Bot, Dispatcher
 from aiogram.utils.exceptions import MessageNotModified
 
 from config import MESSAGES, CHANNELS, REFERRAL_REWARD, MINIMUM_WITHDRAWAL, WELCOME_BONUS
 from keyboards import get_join_keyboard, get_retry_keyboard, get_main_menu_keyboard, get_back_keyboard, get_withdraw_keyboard
-from utils import is_user_in_all_channels, get_user_info_string, format_channel_list
-from database import db
+from utils import (
+    is_user_in_all_channels, invalidate_membership, get_user_info_string, format_channel_list,
+    format_join_required, auto_reply_router,
+)
+from database import adb
+from bot_context import BotContext
+from notifier import referral_notifier
 
 logger = logging.getLogger(__name__)
 
+# Static message texts, built once. Texts that include the channel list are
+# cached on it, so they are rebuilt only when config.CHANNELS changes.
+HELP_TEXT_VERIFIED = (
+    "🤖 **USDT Airdrop Bot**\n\n"
+    "Welcome! You have full access to all bot features.\n\n"
+    "**Available Commands:**\n"
+    "/start - Access main menu\n"
+    "/help - Show this help message\n"
+    "/status - Check your account status\n\n"
+    "**Features:**\n"
+    "💰 Refer friends and earn 0.1 USDT per referral\n"
+    "💸 Withdraw your earnings (minimum 1.0 USDT)\n"
+    "📊 Track your balance and referrals"
+)
+
+@functools.lru_cache(maxsize=4)
+def _unverified_help_text(channel_list: str) -> str:
+    """Help text for users who have not joined the channels yet."""
+    return (
+        "🤖 **Channel Membership Bot**\n\n"
+        "This bot requires you to join specific channels before accessing its features.\n\n"
+        "**Commands:**\n"
+        "/start - Start the bot and check membership\n"
+        "/help - Show this help message\n"
+        "/status - Check your current membership status\n\n"
+        f"{channel_list}\n"
+        "After joining all channels, use the verification button to gain access."
+    )
+
+@functools.lru_cache(maxsize=4)
+def _help_callback_text(channel_list: str) -> str:
+    """Help text shown from the inline menu."""
+    return (
+        "🤖 **Bot Help**\n\n"
+        f"{channel_list}\n"
+        "Use the buttons below to navigate or check your membership status."
+    )
+
 async def start_handler(message: types.Message, bot: Bot):
     """
     Handle the /start command.
@@ -26,11 +70,6 @@ async def start_handler(message: types.Message, bot: Bot):
     
     logger.info(f"Start command from user {user_id} ({user.full_name})")
     
-    # Update start count for tracking
-    start_count = db.update_start_count(user_id)
-    total_starts = db.get_total_start_requests()
-    logger.info(f"User {user_id} start count: {start_count}, Total starts: {total_starts}")
-    
     # Check for referral parameter
     referrer_id = None
     if message.get_args():
@@ -40,46 +79,34 @@ async def start_handler(message: types.Message, bot: Bot):
         except ValueError:
             logger.warning(f"Invalid referral ID: {message.get_args()}")
     
-    # Check if user is in all required channels
-    is_member, missing_channels = await is_user_in_all_channels(bot, user_id)
+    # Check if user is in all required channels (the full channel list is shown either way)
+    is_member, missing_channels = await is_user_in_all_channels(bot, user_id, fail_fast=True)
+    
+    # Record the start; members are registered (with referral reward) in the same transaction
+    username = user.username or ""
+    full_name = user.full_name or f"User {user_id}"
+    start_count, user_added, credited_referrer = await adb.record_start(
+        user_id, username, full_name, referrer_id, register=is_member
+    )
+    total_starts = await adb.get_total_start_requests()
+    logger.info(f"User {user_id} start count: {start_count}, Total starts: {total_starts}")
     
     if not is_member:
         logger.info(f"User {user_id} missing channels: {missing_channels}")
         
-        # Create message with channel links
-        message_text = MESSAGES["join_required"] + "\n\n"
-        for channel in CHANNELS:
-            message_text += f"🔗 https://t.me/{channel['username']} - {channel['name']}\n"
-        message_text += "\nClick the buttons below to join each channel:"
-        
         await message.answer(
-            message_text,
+            format_join_required(),
             reply_markup=get_join_keyboard()
         )
     else:
         logger.info(f"User {user_id} has access to all channels")
         
-        # Add user to database and handle referral
-        username = user.username or ""
-        full_name = user.full_name or f"User {user_id}"
-        
-        user_added = db.add_user(user_id, username, full_name, referrer_id)
         if user_added:
             # Show welcome message with bonus
             welcome_msg = f"🎉 Welcome! You've joined successfully!\n💰 Welcome bonus: +{WELCOME_BONUS} USDT added to your account!"
-            if referrer_id:
-                # Notify referrer about new referral
-                try:
-                    await bot.send_message(
-                        referrer_id,
-                        f"🎉 Great news! You got a new referral!\n"
-                        f"👤 {full_name} just joined using your link\n"
-                        f"💰 You earned +{REFERRAL_REWARD} USDT!\n\n"
-                        f"Keep sharing to earn more!"
-                    )
-                    logger.info(f"Referral notification sent to {referrer_id}")
-                except Exception as e:
-                    logger.error(f"Failed to notify referrer {referrer_id}: {e}")
+            if credited_referrer:
+                # Queued; several referrals in a short window arrive as one message
+                referral_notifier.notify(credited_referrer, full_name)
             
             await message.answer(welcome_msg)
         
@@ -98,43 +125,15 @@ async def help_handler(message: types.Message):
     user = message.from_user
     user_id = user.id
     
-    # Check if user has access to determine help content
-    from database import Database
-    db = Database()
-    
     # Check if user exists in database (meaning they've verified)
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT user_id FROM users WHERE user_id = ?', (user_id,))
-    is_verified = cursor.fetchone() is not None
-    conn.close()
+    is_verified = await adb.get_user_record(user_id) is not None
     
     if is_verified:
         # Clean help for verified users
-        help_text = (
-            "🤖 **USDT Airdrop Bot**\n\n"
-            "Welcome! You have full access to all bot features.\n\n"
-            "**Available Commands:**\n"
-            "/start - Access main menu\n"
-            "/help - Show this help message\n"
-            "/status - Check your account status\n\n"
-            "**Features:**\n"
-            "💰 Refer friends and earn 0.1 USDT per referral\n"
-            "💸 Withdraw your earnings (minimum 1.0 USDT)\n"
-            "📊 Track your balance and referrals"
-        )
+        help_text = HELP_TEXT_VERIFIED
     else:
         # Show channel requirements for unverified users
-        help_text = (
-            "🤖 **Channel Membership Bot**\n\n"
-            "This bot requires you to join specific channels before accessing its features.\n\n"
-            "**Commands:**\n"
-            "/start - Start the bot and check membership\n"
-            "/help - Show this help message\n"
-            "/status - Check your current membership status\n\n"
-            f"{format_channel_list()}\n"
-            "After joining all channels, use the verification button to gain access."
-        )
+        help_text = _unverified_help_text(format_channel_list())
     
     await message.answer(help_text, parse_mode="Markdown")
 
@@ -152,13 +151,7 @@ async def status_handler(message: types.Message, bot: Bot):
     logger.info(f"Status command from user {user_id}")
     
     # Check if user is in database (verified)
-    from database import Database
-    db = Database()
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT balance, referral_count FROM users WHERE user_id = ?', (user_id,))
-    user_data = cursor.fetchone()
-    conn.close()
+    user_data = await adb.get_user_record(user_id)
     
     if user_data:
         # Clean status for verified users - no channel information
@@ -202,6 +195,9 @@ async def check_channels_callback(callback_query: types.CallbackQuery, bot: Bot)
     # Answer the callback query immediately
     await callback_query.answer(MESSAGES["checking"])
     
+    # The user says they joined, so don't trust earlier failed checks
+    invalidate_membership(user_id)
+    
     try:
         # Check if user is now in all channels
         is_member, missing_channels = await is_user_in_all_channels(bot, user_id)
@@ -260,14 +256,8 @@ async def help_callback(callback_query: types.CallbackQuery):
     """
     await callback_query.answer()
     
-    help_text = (
-        "🤖 **Bot Help**\n\n"
-        f"{format_channel_list()}\n"
-        "Use the buttons below to navigate or check your membership status."
-    )
-    
     await callback_query.message.edit_text(
-        help_text,
+        _help_callback_text(format_channel_list()),
         parse_mode="Markdown",
         reply_markup=get_main_menu_keyboard()
     )
@@ -304,15 +294,14 @@ async def status_callback(callback_query: types.CallbackQuery, bot: Bot):
         reply_markup=keyboard
     )
 
-async def refer_callback(callback_query: types.CallbackQuery, bot: Bot):
+async def refer_callback(callback_query: types.CallbackQuery, context: BotContext):
     """Handle the refer & earn callback."""
     await callback_query.answer()
     user = callback_query.from_user
     user_id = user.id
     
-    balance, referral_count = db.get_user_stats(user_id)
-    bot_info = await bot.get_me()
-    referral_link = f"https://t.me/{bot_info.username}?start={user_id}"
+    balance, referral_count = await adb.get_user_stats(user_id)
+    referral_link = context.referral_link(user_id)
     
     refer_text = (
         f"👥 **Refer & Earn Program**\n\n"
@@ -340,7 +329,7 @@ async def balance_callback(callback_query: types.CallbackQuery):
     await callback_query.answer()
     user_id = callback_query.from_user.id
     
-    balance, referral_count = db.get_user_stats(user_id)
+    balance, referral_count = await adb.get_user_stats(user_id)
     
     balance_text = (
         f"💰 **Your Balance**\n\n"
@@ -368,7 +357,7 @@ async def withdraw_callback(callback_query: types.CallbackQuery):
     await callback_query.answer()
     user_id = callback_query.from_user.id
     
-    balance, _ = db.get_user_stats(user_id)
+    balance, _ = await adb.get_user_stats(user_id)
     
     if balance >= MINIMUM_WITHDRAWAL:
         withdraw_text = (
@@ -432,7 +421,7 @@ async def enter_wallet_callback(callback_query: types.CallbackQuery):
         enter_wallet_callback.waiting_for_wallet = set()
     enter_wallet_callback.waiting_for_wallet.add(callback_query.from_user.id)
 
-async def handle_wallet_message(message: types.Message):
+async def handle_wallet_message(message: types.Message, context: BotContext):
     """Handle wallet address messages."""
     user_id = message.from_user.id
     
@@ -441,11 +430,11 @@ async def handle_wallet_message(message: types.Message):
         user_id in enter_wallet_callback.waiting_for_wallet):
         
         wallet_address = message.text.strip()
-        balance, _ = db.get_user_stats(user_id)
+        balance, _ = await adb.get_user_stats(user_id)
         
         if balance >= MINIMUM_WITHDRAWAL:
             # Process withdrawal
-            if db.update_wallet(user_id, wallet_address) and db.deduct_balance(user_id, balance):
+            if await adb.update_wallet(user_id, wallet_address) and await adb.deduct_balance(user_id, balance):
                 await message.answer(
                     f"✅ **Withdrawal Request Submitted**\n\n"
                     f"💰 **Amount:** {balance:.2f} USDT\n"
@@ -470,26 +459,22 @@ async def handle_wallet_message(message: types.Message):
         enter_wallet_callback.waiting_for_wallet.discard(user_id)
     else:
         # Handle other messages with auto-reply
-        await auto_reply_handler(message)
+        await auto_reply_handler(message, context)
 
-async def auto_reply_handler(message: types.Message):
+async def auto_reply_handler(message: types.Message, context: BotContext):
     """Handle unrecognized messages with intelligent auto-replies."""
     user = message.from_user
     user_id = user.id
-    message_text = message.text.lower() if message.text else ""
+    intent = auto_reply_router.match(message.text or "")
     
     # Check if user is verified
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT balance, referral_count FROM users WHERE user_id = ?', (user_id,))
-    user_data = cursor.fetchone()
-    conn.close()
+    user_data = await adb.get_user_record(user_id)
     
     is_verified = user_data is not None
     
     # Auto-reply responses based on message content
-    if any(word in message_text for word in ['help', 'support', 'assist', 'how']):
-        total_starts = db.get_total_start_requests()
+    if intent == 'help':
+        total_starts = await adb.get_total_start_requests()
         await message.answer(
             "🤖 **Auto-Reply: Help**\n\n"
             "I'm here to help! Here are the available commands:\n\n"
@@ -500,7 +485,7 @@ async def auto_reply_handler(message: types.Message):
             "Use the buttons below for quick actions.",
             reply_markup=get_main_menu_keyboard() if is_verified else get_join_keyboard()
         )
-    elif any(word in message_text for word in ['balance', 'money', 'usdt', 'earning', 'earn']):
+    elif intent == 'balance':
         if is_verified:
             balance, referrals = user_data
             await message.answer(
@@ -517,7 +502,7 @@ async def auto_reply_handler(message: types.Message):
                 "To access balance and earning features, please join our required channels first.",
                 reply_markup=get_join_keyboard()
             )
-    elif any(word in message_text for word in ['withdraw', 'payout', 'cash', 'payment']):
+    elif intent == 'withdraw':
         if is_verified:
             balance, _ = user_data
             if balance >= MINIMUM_WITHDRAWAL:
@@ -545,9 +530,9 @@ async def auto_reply_handler(message: types.Message):
                 "Please join our required channels to access withdrawal features.",
                 reply_markup=get_join_keyboard()
             )
-    elif any(word in message_text for word in ['refer', 'invite', 'friend', 'link']):
+    elif intent == 'refer':
         if is_verified:
-            referral_link = f"https://t.me/{MESSAGES['bot_username']}?start={user_id}"
+            referral_link = context.referral_link(user_id)
             await message.answer(
                 f"👥 **Auto-Reply: Your Referral Link**\n\n"
                 f"Earn 0.1 USDT for each successful referral!\n\n"
@@ -562,14 +547,14 @@ async def auto_reply_handler(message: types.Message):
                 "Join our channels to access the referral system and start earning!",
                 reply_markup=get_join_keyboard()
             )
-    elif any(word in message_text for word in ['thank', 'thanks', 'good', 'great', 'awesome']):
+    elif intent == 'thanks':
         await message.answer(
             "😊 **Auto-Reply**\n\n"
             "You're welcome! I'm glad I could help.\n\n"
             "Feel free to use the menu buttons for any other actions you need.",
             reply_markup=get_main_menu_keyboard() if is_verified else get_join_keyboard()
         )
-    elif any(word in message_text for word in ['hi', 'hello', 'hey', 'good morning', 'good evening']):
+    elif intent == 'greeting':
         await message.answer(
             f"👋 **Auto-Reply: Hello!**\n\n"
             f"Hello {user.first_name}! Welcome to our USDT airdrop bot.\n\n"
@@ -590,14 +575,15 @@ async def auto_reply_handler(message: types.Message):
             reply_markup=get_main_menu_keyboard() if is_verified else get_join_keyboard()
         )
 
-def register_handlers(dp: Dispatcher, bot: Bot):
+def register_handlers(dp: Dispatcher, context: BotContext):
     """
     Register all handlers with the dispatcher.
     
     Args:
         dp: Dispatcher instance
-        bot: Bot instance
+        context: Bot instance and identity
     """
+    bot = context.bot
     # Message handlers
     dp.register_message_handler(
         lambda message: start_handler(message, bot),
@@ -625,7 +611,7 @@ def register_handlers(dp: Dispatcher, bot: Bot):
     
     # Referral system callbacks
     dp.register_callback_query_handler(
-        lambda callback_query: refer_callback(callback_query, bot),
+        lambda callback_query: refer_callback(callback_query, context),
         lambda callback_query: callback_query.data == "refer"
     )
     dp.register_callback_query_handler(
@@ -647,7 +633,7 @@ def register_handlers(dp: Dispatcher, bot: Bot):
     
     # Text message handler for wallet addresses
     dp.register_message_handler(
-        handle_wallet_message,
+        lambda message: handle_wallet_message(message, context),
         content_types=['text']
     )
     
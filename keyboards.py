@@ -1,49 +1,46 @@
 """
 Keyboard layouts for the Telegram bot.
+
+Keyboards are built once and kept as pre-serialized JSON strings, which
+aiogram sends as-is instead of rebuilding and re-serializing the markup
+on every reply. The join keyboard depends on config.CHANNELS and is
+rebuilt only when the channel list changes.
 """
 
+import functools
+import json
+
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from config import CHANNELS
+from utils import channels_signature
 
-def get_join_keyboard():
-    """
-    Create an inline keyboard with join buttons for each required channel
-    and a verification button.
-    
-    Returns:
-        InlineKeyboardMarkup: Keyboard with channel join buttons
-    """
+def _serialize(keyboard: InlineKeyboardMarkup) -> str:
+    """Serialize a keyboard the way aiogram would for reply_markup."""
+    return json.dumps(keyboard.to_python())
+
+@functools.lru_cache(maxsize=4)
+def _build_join_keyboard(channels: tuple) -> str:
+    """Build the join keyboard for a channels signature."""
     keyboard = InlineKeyboardMarkup(row_width=1)
     
     # Add join buttons for each channel
-    for channel in CHANNELS:
-        url = f"https://t.me/{channel['username']}"
-        button_text = f"📢 Join {channel['name']}"
+    for name, username in channels:
+        url = f"https://t.me/{username}"
+        button_text = f"📢 Join {name}"
         keyboard.add(InlineKeyboardButton(button_text, url=url))
     
     # Add verification button
     keyboard.add(InlineKeyboardButton("✅ I Joined All Channels", callback_data="check_channels"))
     
-    return keyboard
+    return _serialize(keyboard)
 
-def get_retry_keyboard():
-    """
-    Create a simple retry keyboard for when verification fails.
-    
-    Returns:
-        InlineKeyboardMarkup: Keyboard with retry button
-    """
+def _build_retry_keyboard() -> str:
+    """Build the retry keyboard."""
     keyboard = InlineKeyboardMarkup()
     keyboard.add(InlineKeyboardButton("🔄 Check Again", callback_data="check_channels"))
-    return keyboard
+    return _serialize(keyboard)
 
-def get_main_menu_keyboard():
-    """
-    Create the main menu keyboard for users who have access.
-    
-    Returns:
-        InlineKeyboardMarkup: Main menu keyboard
-    """
+def _build_main_menu_keyboard() -> str:
+    """Build the main menu keyboard."""
     keyboard = InlineKeyboardMarkup(row_width=2)
     
     # Add main menu items
@@ -57,27 +54,69 @@ def get_main_menu_keyboard():
     )
     keyboard.add(InlineKeyboardButton("ℹ️ Help", callback_data="help"))
     
-    return keyboard
+    return _serialize(keyboard)
+
+def _build_back_keyboard() -> str:
+    """Build the back button keyboard."""
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("🔙 Back to Menu", callback_data="back_to_menu"))
+    return _serialize(keyboard)
+
+def _build_withdraw_keyboard() -> str:
+    """Build the withdraw keyboard."""
+    keyboard = InlineKeyboardMarkup()
+    keyboard.add(InlineKeyboardButton("💳 Enter Wallet Address", callback_data="enter_wallet"))
+    keyboard.add(InlineKeyboardButton("🔙 Back to Menu", callback_data="back_to_menu"))
+    return _serialize(keyboard)
 
-def get_back_keyboard():
+# Static keyboards, built once at import
+RETRY_KEYBOARD = _build_retry_keyboard()
+MAIN_MENU_KEYBOARD = _build_main_menu_keyboard()
+BACK_KEYBOARD = _build_back_keyboard()
+WITHDRAW_KEYBOARD = _build_withdraw_keyboard()
+
+def get_join_keyboard() -> str:
     """
-    Create a simple back button keyboard.
+    Get the inline keyboard with join buttons for each required channel
+    and a verification button.
     
     Returns:
-        InlineKeyboardMarkup: Back button keyboard
+        str: Serialized keyboard with channel join buttons
     """
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("🔙 Back to Menu", callback_data="back_to_menu"))
-    return keyboard
+    return _build_join_keyboard(channels_signature())
 
-def get_withdraw_keyboard():
+def get_retry_keyboard() -> str:
     """
-    Create withdraw confirmation keyboard.
+    Get the simple retry keyboard for when verification fails.
     
     Returns:
-        InlineKeyboardMarkup: Withdraw keyboard
+        str: Serialized keyboard with retry button
     """
-    keyboard = InlineKeyboardMarkup()
-    keyboard.add(InlineKeyboardButton("💳 Enter Wallet Address", callback_data="enter_wallet"))
-    keyboard.add(InlineKeyboardButton("🔙 Back to Menu", callback_data="back_to_menu"))
-    return keyboard
+    return RETRY_KEYBOARD
+
+def get_main_menu_keyboard() -> str:
+    """
+    Get the main menu keyboard for users who have access.
+    
+    Returns:
+        str: Serialized main menu keyboard
+    """
+    return MAIN_MENU_KEYBOARD
+
+def get_back_keyboard() -> str:
+    """
+    Get the simple back button keyboard.
+    
+    Returns:
+        str: Serialized back button keyboard
+    """
+    return BACK_KEYBOARD
+
+def get_withdraw_keyboard() -> str:
+    """
+    Get the withdraw confirmation keyboard.
+    
+    Returns:
+        str: Serialized withdraw keyboard
+    """
+    return WITHDRAW_KEYBOARD
@@ -6,11 +6,22 @@ Telegram bot that enforces channel membership requirements before granting acces
 import asyncio
 import logging
 import os
-from aiogram import Bot, Dispatcher, executor
+from aiogram import Dispatcher, executor
+from aiogram.bot.api import TelegramAPIServer
 from aiogram.contrib.fsm_storage.memory import MemoryStorage
 
-from config import BOT_TOKEN, CHANNELS
+from config import (
+    BOT_TOKEN, CHANNELS, TELEGRAM_API_URL, BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_MAX_CONNECTIONS,
+)
+from bot_context import BotContext
 from handlers import register_handlers
+from notifier import referral_notifier
+from polling import BackpressureBot
+from database import adb
+from scheduler import update_scheduler
+from utils import log_membership_cache_stats
+from webhook import SecretTokenWebhookHandler, drain_updates
 
 # Configure logging
 logging.basicConfig(
@@ -19,24 +30,72 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize bot and dispatcher
-bot = Bot(token=BOT_TOKEN)
+# Initialize bot and dispatcher; the bot stops polling while the update backlog is full
+bot = BackpressureBot(token=BOT_TOKEN, server=TelegramAPIServer.from_base(TELEGRAM_API_URL))
 storage = MemoryStorage()
 dp = Dispatcher(bot, storage=storage)
 
+async def on_startup(dp: Dispatcher):
+    """Start background services on the bot's event loop."""
+    referral_notifier.start(dp.bot)
+    asyncio.get_running_loop().create_task(adb.run_maintenance())
+
+async def on_startup_polling(dp: Dispatcher):
+    """Remove any webhook (getUpdates fails while one is set), then start services."""
+    await dp.bot.delete_webhook()
+    await on_startup(dp)
+
+async def on_startup_webhook(dp: Dispatcher):
+    """Register the webhook, keeping updates that queued up while the bot was down."""
+    await dp.bot.set_webhook(
+        WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+        drop_pending_updates=False,
+    )
+    logger.info(f"Webhook set to {WEBHOOK_URL}")
+    await on_startup(dp)
+
+async def on_shutdown(dp: Dispatcher):
+    """Finish in-flight updates and flush queued notifications before exiting."""
+    await drain_updates()
+    await referral_notifier.stop()
+    update_scheduler.log_stats()
+    log_membership_cache_stats()
+
 def main():
     """Main function to start the bot."""
     try:
+        # Fetch the bot's identity once and share it with the handlers
+        context = asyncio.get_event_loop().run_until_complete(BotContext.create(bot))
+        
+        # Bound and order update processing ahead of the handlers
+        dp.middleware.setup(update_scheduler)
+
         # Register all handlers
-        register_handlers(dp, bot)
+        register_handlers(dp, context)
         
         logger.info("Bot started successfully")
         logger.info(f"Monitoring {len(CHANNELS)} required channels:")
         for channel in CHANNELS:
             logger.info(f"  - {channel['name']} (@{channel['username']})")
         
-        # Start polling
-        executor.start_polling(dp, skip_updates=True)
+        if BOT_MODE == "webhook":
+            # Serve updates pushed by Telegram; the webhook stays registered
+            # across restarts so Telegram holds the backlog meanwhile
+            logger.info(f"Listening for webhook updates on {WEBAPP_HOST}:{WEBAPP_PORT}{WEBHOOK_PATH}")
+            bot_executor = executor.Executor(dp)
+            bot_executor.on_startup(on_startup_webhook, polling=False, webhook=True)
+            bot_executor.on_shutdown(on_shutdown, polling=False, webhook=True)
+            bot_executor.start_webhook(
+                webhook_path=WEBHOOK_PATH,
+                request_handler=SecretTokenWebhookHandler,
+                host=WEBAPP_HOST,
+                port=WEBAPP_PORT,
+            )
+        else:
+            # Start polling
+            executor.start_polling(dp, skip_updates=True, on_startup=on_startup_polling, on_shutdown=on_shutdown)
         
     except Exception as e:
         logger.error(f"Failed to start bot: {e}")
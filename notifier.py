@@ -0,0 +1,181 @@
+"""
+Referral reward notifications sent from the bot's event loop.
+"""
+
+import asyncio
+import logging
+import time
+from html import escape
+from typing import Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter
+
+from broadcast import PerChatLimiter, TokenBucket
+from config import (
+    REFERRAL_REWARD, NOTIFY_QUEUE_SIZE, NOTIFY_BATCH_WINDOW, NOTIFY_RATE, NOTIFY_MAX_RETRIES,
+    BROADCAST_PER_CHAT_RATE,
+)
+from database import AsyncDatabase, adb
+
+logger = logging.getLogger(__name__)
+
+def format_referral_notification(names: List[str], balance: float, referral_count: int) -> str:
+    """
+    Build the message telling a referrer about one or more new referrals.
+
+    Args:
+        names: Display names of the referred users
+        balance: Referrer's current balance
+        referral_count: Referrer's total referrals
+
+    Returns:
+        str: HTML-formatted notification
+    """
+    names = [escape(name) for name in names]
+    if len(names) == 1:
+        header = "🎉 <b>New Referral Reward!</b> 🎉"
+        joined = f"👤 {names[0]} just joined using your link"
+    else:
+        header = f"🎉 <b>{len(names)} New Referrals!</b> 🎉"
+        shown = ", ".join(names[:5])
+        more = f" and {len(names) - 5} more" if len(names) > 5 else ""
+        joined = f"👥 {shown}{more} just joined using your link"
+
+    return f"""{header}
+
+{joined}
+💰 You earned <b>+{REFERRAL_REWARD * len(names):.2f} USDT</b>!
+
+📊 <b>Your Stats:</b>
+💵 Current Balance: <b>{balance:.2f} USDT</b>
+👥 Total Referrals: <b>{referral_count}</b>
+
+Keep sharing your referral link to earn more! 🚀"""
+
+class ReferralNotifier:
+    """
+    Single dispatcher for referral notifications.
+
+    Handlers enqueue referrals without waiting. One task on the bot's event
+    loop collects them for NOTIFY_BATCH_WINDOW seconds, merges every
+    referral of the same referrer into one message, and sends through the
+    bot's own HTTP session under global and per-chat rate limits.
+    """
+
+    def __init__(self, database: AsyncDatabase = adb, queue_size: int = NOTIFY_QUEUE_SIZE,
+                 window: float = NOTIFY_BATCH_WINDOW, rate: float = NOTIFY_RATE,
+                 max_retries: int = NOTIFY_MAX_RETRIES):
+        self.database = database
+        self.queue_size = queue_size
+        self.window = window
+        self.bucket = TokenBucket(rate)
+        self.per_chat = PerChatLimiter(BROADCAST_PER_CHAT_RATE)
+        self.max_retries = max_retries
+        self.bot: Optional[Bot] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._sending: Optional[asyncio.Task] = None
+        self._pending: Dict[int, List[str]] = {}
+        self.sent = 0
+        self.dropped = 0
+
+    def start(self, bot: Bot):
+        """Start the dispatcher task on the running event loop."""
+        self.bot = bot
+        self._queue = asyncio.Queue(self.queue_size)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info("Referral notifier started")
+
+    async def stop(self):
+        """Finish the batch being sent and send what is already queued, then stop the dispatcher."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._sending is not None:
+            await self._sending
+            self._sending = None
+        pending, self._pending = self._drain(self._pending), {}
+        if pending:
+            await self._send_batches(pending)
+
+    def notify(self, referrer_id: int, referred_name: str):
+        """
+        Queue a notification about a new referral.
+
+        Never blocks: if the queue is full the notification is dropped and
+        logged, since the reward itself is already stored.
+        """
+        if self._queue is None:
+            logger.warning(f"Referral notifier not running, dropping notification for {referrer_id}")
+            return
+        try:
+            self._queue.put_nowait((referrer_id, referred_name))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Notification queue full, dropping notification for {referrer_id}")
+
+    def _drain(self, pending: Dict[int, List[str]]) -> Dict[int, List[str]]:
+        """Move everything currently queued into pending, grouped by referrer."""
+        while True:
+            try:
+                referrer_id, name = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return pending
+            pending.setdefault(referrer_id, []).append(name)
+
+    async def _run(self):
+        """Collect referrals for one window at a time and send them."""
+        while True:
+            referrer_id, name = await self._queue.get()
+            self._pending = {referrer_id: [name]}
+            deadline = time.monotonic() + self.window
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    referrer_id, name = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self._pending.setdefault(referrer_id, []).append(name)
+            pending, self._pending = self._pending, {}
+            # Shielded so stop() cancelling the loop lets the batch in flight finish
+            self._sending = asyncio.ensure_future(self._send_batches(pending))
+            await asyncio.shield(self._sending)
+            self._sending = None
+
+    async def _send_batches(self, pending: Dict[int, List[str]]):
+        """Send one message per referrer."""
+        results = await asyncio.gather(
+            *(self._send(referrer_id, names) for referrer_id, names in pending.items()),
+            return_exceptions=True
+        )
+        for referrer_id, result in zip(pending, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to notify referrer {referrer_id}: {result}")
+
+    async def _send(self, referrer_id: int, names: List[str]):
+        """Send one referrer's notification, honouring retry_after."""
+        balance, referral_count = await self.database.get_user_stats(referrer_id)
+        text = format_referral_notification(names, balance, referral_count)
+
+        for attempt in range(self.max_retries + 1):
+            await self.per_chat.wait(referrer_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(referrer_id, text, parse_mode='HTML')
+            except RetryAfter as e:
+                self.bucket.pause(e.timeout)
+                if attempt == self.max_retries:
+                    raise
+                continue
+            self.bucket.record_success()
+            self.sent += 1
+            logger.info(f"Referral notification sent to {referrer_id} ({len(names)} referrals)")
+            return
+
+# Global notifier instance
+referral_notifier = ReferralNotifier()
@@ -0,0 +1,27 @@
+"""
+Long polling with backpressure from the update scheduler.
+"""
+
+from aiogram import Bot
+
+from scheduler import UpdateScheduler, update_scheduler
+
+class BackpressureBot(Bot):
+    """
+    Bot that holds off getUpdates while the update scheduler is saturated.
+
+    aiogram 2's polling loop hands every batch of updates to a task it never
+    awaits and fetches the next batch right away, so nothing slows it down
+    when handlers fall behind. Waiting for the scheduler's backlog to drop
+    below UPDATE_MAX_PENDING before each getUpdates call leaves the updates
+    with Telegram meanwhile - the polling counterpart of the webhook's 429.
+    The backlog can still exceed the limit by up to one batch (100 updates).
+    """
+
+    def __init__(self, *args, scheduler: UpdateScheduler = update_scheduler, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    async def get_updates(self, *args, **kwargs):
+        await self.scheduler.wait_for_capacity()
+        return await super().get_updates(*args, **kwargs)
@@ -0,0 +1,245 @@
+"""
+Update scheduling between the dispatcher and the handlers.
+
+aiogram 2 starts every update as soon as it arrives, so a burst of slow
+handlers (channel checks with several get_chat_member calls) runs without
+limit, and two updates from the same user can interleave - e.g. a double
+tapped withdrawal. The scheduler runs as an update middleware: it admits
+updates of different users in parallel up to UPDATE_CONCURRENCY, runs one
+user's updates strictly one after another, and records how long each update
+spent in every stage. Once UPDATE_MAX_PENDING updates are queued, webhook
+requests are refused with 429 (webhook.py) and polling stops fetching
+(polling.py) until the backlog shrinks.
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import types
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+from config import UPDATE_CONCURRENCY, UPDATE_MAX_PENDING, UPDATE_STATS_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds; slower samples land in a final overflow bucket
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Update fields whose object carries the sending user, in the order they are checked
+USER_FIELDS = (
+    'message', 'callback_query', 'edited_message', 'inline_query', 'chosen_inline_result',
+    'shipping_query', 'pre_checkout_query', 'my_chat_member', 'chat_member', 'chat_join_request',
+)
+
+# Key of the scheduling state in the middleware data of one update
+STATE_KEY = '_scheduler_state'
+
+class LatencyHistogram:
+    """Counts latency samples in fixed buckets; cheap enough to record every update."""
+
+    def __init__(self, bounds_ms: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.bounds = bounds_ms
+        self.counts = [0] * (len(bounds_ms) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        """Record one sample."""
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Estimate a percentile from the buckets.
+
+        Args:
+            fraction: Percentile as a fraction, e.g. 0.95
+
+        Returns:
+            float: Upper bound in ms of the bucket holding the percentile, capped
+                at the observed maximum; 0 without samples
+        """
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Get count, mean, p50/p95/p99 and max in ms."""
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 2) if self.count else 0.0,
+            'p50': round(self.percentile(0.50), 2),
+            'p95': round(self.percentile(0.95), 2),
+            'p99': round(self.percentile(0.99), 2),
+            'max': round(self.max, 2),
+        }
+
+class UserSlot:
+    """Per-user lock shared by that user's queued updates."""
+
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+def update_user_id(update: types.Update) -> Optional[int]:
+    """
+    Find the user an update belongs to.
+
+    Args:
+        update: Incoming update
+
+    Returns:
+        Optional[int]: Sender's user ID, the chat ID for channel posts, or None
+    """
+    for field in USER_FIELDS:
+        obj = getattr(update, field)
+        if obj is not None and obj.from_user is not None:
+            return obj.from_user.id
+    post = update.channel_post or update.edited_channel_post
+    return post.chat.id if post is not None else None
+
+class UpdateScheduler(BaseMiddleware):
+    """
+    Middleware that bounds and orders update processing.
+
+    Stages of every update, each with its own latency histogram:
+    - user_wait: waiting for the same user's earlier updates to finish
+    - queue_wait: waiting for one of the UPDATE_CONCURRENCY handler slots
+    - handler: running the handlers
+    - total: from arrival to completion
+
+    Waiting for the user's lock comes first so a user flooding the bot only
+    queues behind themselves instead of holding slots other users need.
+    """
+
+    STAGES = ('user_wait', 'queue_wait', 'handler', 'total')
+
+    def __init__(self, concurrency: int = UPDATE_CONCURRENCY, max_pending: int = UPDATE_MAX_PENDING,
+                 stats_interval: float = UPDATE_STATS_INTERVAL):
+        super().__init__()
+        self.concurrency = concurrency
+        self.max_pending = max_pending
+        self.stats_interval = stats_interval
+        self._slots = asyncio.Semaphore(concurrency)
+        self._users: Dict[int, UserSlot] = {}
+        self.histograms = {stage: LatencyHistogram() for stage in self.STAGES}
+        self.pending = 0
+        self.running = 0
+        self.refused = 0
+        self._capacity = asyncio.Event()
+        self._capacity.set()
+        self._next_report = time.monotonic() + stats_interval
+
+    @property
+    def saturated(self) -> bool:
+        """Whether new updates should be refused until the backlog shrinks."""
+        return self.pending >= self.max_pending
+
+    async def wait_for_capacity(self):
+        """Wait until the backlog is below max_pending, e.g. before fetching more updates."""
+        await self._capacity.wait()
+
+    def refuse(self):
+        """Count an update turned away by the webhook because of backpressure."""
+        self.refused += 1
+        if self.refused == 1 or self.refused % 100 == 0:
+            logger.warning(f"Update backlog full ({self.pending} pending), refused {self.refused} updates so far")
+
+    async def on_pre_process_update(self, update: types.Update, data: dict):
+        arrived = time.monotonic()
+        self.pending += 1
+        if self.saturated:
+            self._capacity.clear()
+        user_id = update_user_id(update)
+        slot = None
+        if user_id is not None:
+            slot = self._users.get(user_id)
+            if slot is None:
+                slot = self._users[user_id] = UserSlot()
+            slot.users += 1
+
+        user_locked = False
+        try:
+            if slot is not None:
+                await slot.lock.acquire()
+                user_locked = True
+            locked = time.monotonic()
+            await self._slots.acquire()
+        except BaseException:
+            # Cancelled while waiting: give back the user's lock if it was taken
+            self._leave(user_id, slot, user_locked)
+            raise
+
+        started = time.monotonic()
+        self.running += 1
+        self.histograms['user_wait'].observe(locked - arrived)
+        self.histograms['queue_wait'].observe(started - locked)
+        data[STATE_KEY] = (user_id, slot, arrived, started)
+
+    async def on_post_process_update(self, update: types.Update, results: List, data: dict):
+        state = data.get(STATE_KEY)
+        if state is None:
+            return
+        user_id, slot, arrived, started = state
+        finished = time.monotonic()
+        self.running -= 1
+        self._slots.release()
+        self._leave(user_id, slot, slot is not None)
+        self.histograms['handler'].observe(finished - started)
+        self.histograms['total'].observe(finished - arrived)
+
+        if finished >= self._next_report:
+            self._next_report = finished + self.stats_interval
+            self.log_stats()
+
+    def _leave(self, user_id: Optional[int], slot: Optional[UserSlot], release: bool):
+        """Release the user's lock and forget it once no update of theirs is queued."""
+        self.pending -= 1
+        if not self.saturated:
+            self._capacity.set()
+        if slot is None:
+            return
+        if release:
+            slot.lock.release()
+        slot.users -= 1
+        if not slot.users:
+            self._users.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Get the latency summary of every stage plus current load."""
+        stats = {stage: histogram.summary() for stage, histogram in self.histograms.items()}
+        stats['load'] = {
+            'pending': self.pending,
+            'running': self.running,
+            'users': len(self._users),
+            'refused': self.refused,
+        }
+        return stats
+
+    def log_stats(self):
+        """Write the stage latencies to the log."""
+        for stage in self.STAGES:
+            s = self.histograms[stage].summary()
+            logger.info(f"Update {stage}: n={s['count']} mean={s['mean']}ms p50<={s['p50']}ms "
+                        f"p95<={s['p95']}ms p99<={s['p99']}ms max={s['max']}ms")
+        logger.info(f"Update load: {self.pending} pending, {self.running} running, "
+                    f"{len(self._users)} users queued, {self.refused} refused")
+
+# Global update scheduler instance
+update_scheduler = UpdateScheduler()
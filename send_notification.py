@@ -1,98 +1,133 @@
 #!/usr/bin/env python3
 """
 Send notification to all bot users
-Usage: python send_notification.py "Your message here"
+Usage: python send_notification.py "Your message here" [--dry-run] [--concurrency N] [--yes]
+       python send_notification.py --resume JOB_ID
 """
 
-import os
+import argparse
+import asyncio
 import sys
-import sqlite3
-import requests
 import time
-from datetime import datetime
-
-def get_bot_users():
-    """Get all user IDs from database."""
-    try:
-        conn = sqlite3.connect('bot_users.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT user_id FROM users')
-        users = [row[0] for row in cursor.fetchall()]
-        
-        conn.close()
-        return users
-    except Exception as e:
-        print(f"Database error: {e}")
-        return []
-
-def send_notification(user_ids, message):
-    """Send notification to users using Telegram Bot API."""
-    bot_token = os.getenv('BOT_TOKEN')
-    if not bot_token:
-        print("Error: BOT_TOKEN environment variable not set")
-        return
-    
-    success_count = 0
-    failed_count = 0
-    
-    print(f"Sending notification to {len(user_ids)} users...")
-    print(f"Message: {message}")
+
+from config import BROADCAST_CONCURRENCY, DATABASE_PATH
+from database import Database
+from broadcast import format_notification, run_broadcast_job
+
+class ThroughputMeter:
+    """Prints a live sent/failed/rate line while a job runs."""
+
+    def __init__(self, total: int, done: int = 0):
+        self.total = total
+        self.done = done
+        self.sent = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._last_print = 0.0
+
+    def __call__(self, user_id: int, delivered: bool):
+        if delivered:
+            self.sent += 1
+        else:
+            self.failed += 1
+        now = time.monotonic()
+        if now - self._last_print >= 1.0:
+            self._last_print = now
+            self.print_line()
+
+    def rate(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return (self.sent + self.failed) / elapsed if elapsed > 0 else 0.0
+
+    def print_line(self, end: str = "\r"):
+        progress = self.done + self.sent + self.failed
+        print(f"📤 {progress}/{self.total}  ✅ {self.sent}  ❌ {self.failed}  ⚡ {self.rate():.1f} msg/s   ",
+              end=end, flush=True)
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Send a notification to every bot user.")
+    parser.add_argument("message", nargs="?", help="Notification text (HTML allowed)")
+    parser.add_argument("--resume", type=int, metavar="JOB", help="Resume an interrupted broadcast job")
+    parser.add_argument("--dry-run", action="store_true", help="Count recipients without sending anything")
+    parser.add_argument("--concurrency", type=int, default=BROADCAST_CONCURRENCY,
+                        help=f"Simultaneous requests (default: {BROADCAST_CONCURRENCY})")
+    parser.add_argument("--db", default=DATABASE_PATH, help=f"Database file (default: {DATABASE_PATH})")
+    parser.add_argument("-y", "--yes", action="store_true", help="Do not ask for confirmation")
+    args = parser.parse_args(argv)
+    if not args.message and args.resume is None:
+        parser.error("a message is required unless --resume is given")
+    return args
+
+def dry_run(db: Database, message: str):
+    """Show what would be sent without contacting Telegram."""
+    recipients = 0
+    sample = []
+    for user_id in db.iter_user_ids():
+        recipients += 1
+        if len(sample) < 5:
+            sample.append(user_id)
+    print("Dry run - nothing will be sent")
+    print(f"Message: {format_notification(message)}")
+    print(f"Recipients: {recipients} (first: {', '.join(map(str, sample)) or 'none'})")
+
+def send(db: Database, job_id: int, concurrency: int) -> int:
+    """Run a job to completion, printing live throughput. Returns the exit code."""
+    job = db.get_broadcast_job(job_id)
+    done = job['sent'] + job['failed']
+    meter = ThroughputMeter(job['total'], done)
+
+    print(f"Sending job #{job_id} to {job['total'] - done} remaining users...")
+    print(f"Message: {job['message']}")
     print("-" * 50)
-    
-    for i, user_id in enumerate(user_ids, 1):
-        try:
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-            data = {
-                'chat_id': user_id,
-                'text': f"📢 NOTIFICATION 📢\n\n{message}",
-                'parse_mode': 'HTML'
-            }
-            
-            response = requests.post(url, data=data, timeout=10)
-            
-            if response.status_code == 200:
-                success_count += 1
-                print(f"✅ [{i}/{len(user_ids)}] Sent to user {user_id}")
-            else:
-                failed_count += 1
-                print(f"❌ [{i}/{len(user_ids)}] Failed to send to user {user_id}: {response.text}")
-            
-            # Rate limiting - wait between requests
-            time.sleep(0.1)
-            
-        except Exception as e:
-            failed_count += 1
-            print(f"❌ [{i}/{len(user_ids)}] Error sending to user {user_id}: {e}")
-    
+
+    job = asyncio.run(run_broadcast_job(job_id, db, concurrency=concurrency, on_result=meter))
+    if job is None:
+        print(f"Job #{job_id} is being sent by another process (admin panel or another --resume)")
+        return 1
+    meter.print_line(end="\n")
+
     print("-" * 50)
-    print(f"✅ Success: {success_count}")
-    print(f"❌ Failed: {failed_count}")
-    print(f"📊 Total: {len(user_ids)}")
-
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python send_notification.py \"Your message here\"")
-        print("Example: python send_notification.py \"Welcome to our new feature!\"")
-        return
-    
-    message = sys.argv[1]
-    
-    # Get all users
-    users = get_bot_users()
+    print(f"✅ Success: {job['sent']}")
+    print(f"❌ Failed: {job['failed']}")
+    print(f"📊 Total: {job['total']}")
+    return 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    db = Database(args.db)
+
+    if args.resume is not None:
+        job = db.get_broadcast_job(args.resume)
+        if job is None:
+            print(f"Job #{args.resume} not found")
+            return 1
+        if job['status'] == 'done':
+            print(f"Job #{args.resume} already finished ({job['sent']} sent, {job['failed']} failed)")
+            return 0
+        return send(db, args.resume, args.concurrency)
+
+    if args.dry_run:
+        dry_run(db, args.message)
+        return 0
+
+    users = db.get_connection().execute('SELECT COUNT(*) FROM users').fetchone()[0]
     if not users:
         print("No users found in database")
-        return
-    
+        return 0
+
     # Confirm before sending
-    print(f"About to send notification to {len(users)} users:")
-    print(f"Message: {message}")
-    confirm = input("Continue? (y/N): ").lower().strip()
-    
-    if confirm == 'y':
-        send_notification(users, message)
-    else:
+    print(f"About to send notification to {users} users:")
+    print(f"Message: {args.message}")
+    if not args.yes and input("Continue? (y/N): ").lower().strip() != 'y':
         print("Cancelled")
+        return 0
+
+    job_id = db.create_broadcast_job(format_notification(args.message))
+    if job_id is None:
+        print("Could not create the broadcast job")
+        return 1
+    print(f"Created job #{job_id} (resume with --resume {job_id} if interrupted)")
+    return send(db, job_id, args.concurrency)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
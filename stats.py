@@ -0,0 +1,112 @@
+"""
+Precomputed statistics for the admin panel.
+
+The dashboard aggregates are collected at most once per refresh interval into
+an immutable snapshot that every admin endpoint serves from, so the number of
+open admin tabs no longer multiplies the database load.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from config import STATS_REFRESH_INTERVAL, STATS_RECENT_USERS
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+class StatsSnapshot:
+    """
+    Dashboard aggregates as of one refresh.
+
+    `version` only changes when the data does (or when the minute changes,
+    so relative "time ago" values do not go stale), which keeps ETags stable
+    between refreshes of an idle database.
+    """
+
+    def __init__(self, data: Dict[str, Any], generated_at: Optional[datetime] = None):
+        self.data = data
+        self.generated_at = generated_at or datetime.now()
+        digest = hashlib.sha1(repr(data).encode('utf-8'))
+        digest.update(self.generated_at.strftime('%Y-%m-%d %H:%M').encode('utf-8'))
+        self.version = digest.hexdigest()[:16]
+        self._rendered: Dict[str, Tuple[bytes, str]] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def render(self, name: str, builder: Callable[["StatsSnapshot"], dict]) -> Tuple[bytes, str]:
+        """
+        Serialize a payload built from this snapshot, once per snapshot.
+
+        Args:
+            name: Payload name, part of the ETag
+            builder: Builds the JSON-serializable payload from the snapshot
+
+        Returns:
+            Tuple[bytes, str]: (JSON body, ETag)
+        """
+        rendered = self._rendered.get(name)
+        if rendered is None:
+            body = json.dumps(builder(self)).encode('utf-8')
+            rendered = (body, f"{name}-{self.version}")
+            self._rendered[name] = rendered
+        return rendered
+
+class StatsService:
+    """Serves the current snapshot, refreshing it when it is older than the interval."""
+
+    def __init__(self, database: Database = db, interval: float = STATS_REFRESH_INTERVAL,
+                 recent_limit: int = STATS_RECENT_USERS, clock: Callable[[], float] = time.monotonic):
+        self.database = database
+        self.interval = interval
+        self.recent_limit = recent_limit
+        self._clock = clock
+        self._snapshot: Optional[StatsSnapshot] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def snapshot(self) -> StatsSnapshot:
+        """
+        Get the current snapshot, refreshing it first if it has expired.
+
+        Only one thread refreshes at a time; the others wait and reuse its result.
+
+        Returns:
+            StatsSnapshot: The current snapshot
+
+        Raises:
+            RuntimeError: If no snapshot could be collected yet
+        """
+        if self._clock() >= self._expires_at:
+            with self._lock:
+                if self._clock() >= self._expires_at:
+                    self.refresh()
+        if self._snapshot is None:
+            raise RuntimeError("Statistics are unavailable")
+        return self._snapshot
+
+    def refresh(self):
+        """Collect fresh aggregates. On failure the previous snapshot is kept."""
+        data = self.database.get_dashboard_stats(self.recent_limit)
+        self._expires_at = self._clock() + self.interval
+        if data is None:
+            logger.error("Stats refresh failed, serving the previous snapshot")
+            return
+
+        snapshot = StatsSnapshot(data)
+        self.refreshes += 1
+        if self._snapshot is None or snapshot.version != self._snapshot.version:
+            self._snapshot = snapshot
+
+    def invalidate(self):
+        """Force the next request to refresh, e.g. after an admin write."""
+        self._expires_at = 0.0
+
+# Global stats service instance
+stats_service = StatsService()
@@ -0,0 +1,17 @@
+"""
+Shared test setup.
+
+config.py requires BOT_TOKEN, and database.py opens DATABASE_PATH when it is
+imported, so both are pointed at throwaway values before any test module
+imports the bot's modules.
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("BOT_TOKEN", "123456:test-token")
+os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bot-tests-"), "bot_users.db")
@@ -0,0 +1,97 @@
+"""
+Broadcast job ownership: one process sends a job at a time; sender retries.
+"""
+
+import asyncio
+import time
+
+import aiohttp
+import pytest
+
+from broadcast import BROADCAST_OWNER, BroadcastManager, TelegramSender, run_broadcast_job
+from database import Database
+
+@pytest.fixture
+def database(tmp_path):
+    return Database(str(tmp_path / "t.db"))
+
+def owner_of(database: Database, job_id: int):
+    return database.get_connection().execute(
+        'SELECT owner, heartbeat FROM broadcast_jobs WHERE id = ?', (job_id,)
+    ).fetchone()
+
+def test_claim_respects_fresh_heartbeats(database):
+    job_id = database.create_broadcast_job("hello")
+
+    assert database.claim_broadcast_job(job_id, "cli:1", now=1000.0, stale_before=940.0)
+    # Another process is refused while the heartbeat is fresh...
+    assert not database.claim_broadcast_job(job_id, "admin:2", now=1010.0, stale_before=950.0)
+    assert database.heartbeat_broadcast_job(job_id, "cli:1", now=1050.0)
+    assert not database.claim_broadcast_job(job_id, "admin:2", now=1100.0, stale_before=1040.0)
+    # ...and takes over once it is stale; the old owner then loses its heartbeat
+    assert database.claim_broadcast_job(job_id, "admin:2", now=1200.0, stale_before=1140.0)
+    assert not database.heartbeat_broadcast_job(job_id, "cli:1", now=1201.0)
+
+    assert not database.release_broadcast_job(job_id, "cli:1")
+    assert database.release_broadcast_job(job_id, "admin:2")
+    assert owner_of(database, job_id) == (None, None)
+
+def test_resume_skips_jobs_another_process_is_sending(database, monkeypatch):
+    running = database.create_broadcast_job("owned elsewhere")
+    abandoned = database.create_broadcast_job("owner died")
+    queued = database.create_broadcast_job("never started")
+    now = time.time()
+    database.claim_broadcast_job(running, "cli:1", now=now, stale_before=0)
+    database.claim_broadcast_job(abandoned, "cli:2", now=now - 3600, stale_before=0)
+
+    manager = BroadcastManager(database)
+    submitted = []
+    monkeypatch.setattr(manager, 'submit', submitted.append)
+
+    assert manager.resume_unfinished() == [abandoned, queued]
+    assert submitted == [abandoned, queued]
+
+def test_run_does_not_send_a_job_owned_elsewhere(database):
+    job_id = database.create_broadcast_job("hello")
+    database.claim_broadcast_job(job_id, "cli:1", now=time.time(), stale_before=0)
+
+    assert asyncio.run(run_broadcast_job(job_id, database)) is None
+    assert owner_of(database, job_id)[0] == "cli:1"
+    assert database.get_broadcast_job(job_id)['status'] == 'queued'
+
+def test_run_releases_the_job_when_done(database):
+    job_id = database.create_broadcast_job("hello")  # No users, nothing to send
+
+    job = asyncio.run(run_broadcast_job(job_id, database))
+
+    assert job['status'] == 'done'
+    assert owner_of(database, job_id) == (None, None)
+    assert not database.claim_broadcast_job(job_id, BROADCAST_OWNER, now=time.time(), stale_before=0)
+
+class UnreachableSession:
+    def __init__(self):
+        self.posts = 0
+
+    def post(self, url, data):
+        self.posts += 1
+        raise aiohttp.ClientConnectionError("connection refused")
+
+def test_no_backoff_after_the_last_network_error(monkeypatch):
+    backoffs = []
+    sleep = asyncio.sleep
+
+    async def recording_sleep(seconds):
+        if seconds >= 1:
+            backoffs.append(seconds)
+        await sleep(0)
+
+    monkeypatch.setattr(asyncio, 'sleep', recording_sleep)
+    sender = TelegramSender("123456:test-token", rate=1000, per_chat_rate=1000, max_retries=2)
+    sender._session = UnreachableSession()
+
+    response = asyncio.run(sender.send_message(1, "hello"))
+
+    assert response == {'ok': False, 'description': "connection refused"}
+    assert sender._session.posts == 3
+    # Backoff between attempts only, none after giving up
+    assert backoffs == [1, 2]
@@ -0,0 +1,81 @@
+"""
+Pooled SQLite connections.
+"""
+
+import sqlite3
+import threading
+
+import pytest
+
+import database
+from database import Database
+
+@pytest.fixture
+def connects(monkeypatch):
+    """Count sqlite3.connect calls made by the database module."""
+    calls = []
+    connect = sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        calls.append(args)
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(database.sqlite3, 'connect', counting_connect)
+    return calls
+
+def test_one_thread_reuses_one_connection(tmp_path, connects):
+    db = Database(str(tmp_path / "t.db"))
+    conn = db.get_connection()
+    assert len(connects) == 1  # Opened for the migrations
+
+    for user_id in range(1, 101):
+        db.record_start(user_id, f"user{user_id}", f"User {user_id}")
+        db.get_user_record(user_id)
+        db.user_cache.clear()
+        db.get_user_record(user_id)
+
+    assert len(connects) == 1
+    assert db.get_connection() is conn
+    assert db.pool.stats()['connects'] == 1
+
+def test_released_connections_are_reused_and_closed(tmp_path, connects):
+    db = Database(str(tmp_path / "t.db"))
+    db.release_connection()
+    assert db.pool.stats()['idle'] == 1
+
+    seen = []
+
+    def request():
+        # Like a Flask request: borrow, query, give back
+        conn = db.get_connection()
+        conn.execute('SELECT COUNT(*) FROM users').fetchone()
+        seen.append(conn)
+        db.release_connection()
+
+    for _ in range(20):
+        thread = threading.Thread(target=request)
+        thread.start()
+        thread.join()
+
+    assert len(connects) == 1
+    assert len(set(map(id, seen))) == 1
+
+    db.pool.close_all()
+    assert db.pool.stats()['idle'] == 0
+    with pytest.raises(sqlite3.ProgrammingError):
+        seen[0].execute('SELECT 1')
+
+def test_failed_write_leaves_no_transaction_open(tmp_path):
+    db = Database(str(tmp_path / "t.db"))
+    db.record_start(1, "user1", "User 1")
+    conn = db.get_connection()
+    conn.execute('''
+        CREATE TRIGGER reject_wallet BEFORE UPDATE OF wallet_address ON users
+        BEGIN SELECT RAISE(ABORT, 'rejected'); END
+    ''')
+    conn.commit()
+
+    assert db.update_wallet(1, "TWallet") is False
+    # The pooled connection is reused, so the next writer must be able to BEGIN
+    assert not conn.in_transaction
+    assert db.deduct_balance(1, 0.05) is True
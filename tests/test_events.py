@@ -0,0 +1,84 @@
+"""
+Activity events outbox and the admin live feed.
+"""
+
+import asyncio
+
+from database import AsyncDatabase, Database
+
+def add_users(database: Database, count: int, first_id: int = 1):
+    for user_id in range(first_id, first_id + count):
+        database.record_start(user_id, f"user{user_id}", f"User {user_id}")
+
+def test_bot_maintenance_prunes_events_without_subscribers(tmp_path):
+    database = Database(str(tmp_path / "t.db"))
+    add_users(database, 30)
+    async_db = AsyncDatabase(database)
+
+    async def run():
+        task = asyncio.create_task(async_db.run_maintenance(interval=0.01, prune_interval=0.01, retention=10))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    try:
+        asyncio.run(run())
+    finally:
+        async_db.close()
+
+    ids = [row[0] for row in database.get_events(0, 100)]
+    assert ids == list(range(21, 31))
+
+def test_new_stream_client_gets_events_written_after_the_snapshot():
+    from admin_app import app
+    from database import db
+    from stats import stats_service
+
+    add_users(db, 2, first_id=1000)
+    snapshot = stats_service.snapshot()
+    assert snapshot['last_event_id'] == db.get_last_event_id()
+
+    # Joins while the cached snapshot is still being served
+    add_users(db, 1, first_id=2000)
+    assert stats_service.snapshot() is snapshot
+
+    response = app.test_client().get('/api/stream', buffered=False)
+    messages = []
+    try:
+        for chunk in response.response:
+            messages.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+            # Stops at the first keep-alive if the event never arrives
+            if '"user_id":2000' in messages[-1] or messages[-1].startswith(': keep-alive'):
+                break
+    finally:
+        response.close()
+    assert messages[1].startswith('event: snapshot')
+    assert 'event: user_joined' in messages[-1]
+    assert '"user_id":2000' in messages[-1]
+
+def test_new_stream_client_skips_events_already_in_the_snapshot():
+    from admin_app import app
+    from database import db
+    from events import Event, event_bus
+    from stats import stats_service
+
+    add_users(db, 1, first_id=3000)
+    stats_service.invalidate()
+    last_id = stats_service.snapshot()['last_event_id']
+    assert last_id == db.get_last_event_id()
+
+    response = app.test_client().get('/api/stream', buffered=False)
+    messages = []
+    try:
+        # A tailer still behind the snapshot delivers an event the snapshot covers
+        event_bus.publish(Event(last_id, 'user_joined', '{"user_id":"stale"}'))
+        event_bus.publish(Event(last_id + 1, 'user_joined', '{"user_id":"fresh"}'))
+        for chunk in response.response:
+            messages.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+            if '"fresh"' in messages[-1] or messages[-1].startswith(': keep-alive'):
+                break
+    finally:
+        response.close()
+    assert messages[1].startswith('event: snapshot')
+    assert not any('"stale"' in message for message in messages)
+    assert '"fresh"' in messages[-1]
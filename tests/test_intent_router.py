@@ -0,0 +1,59 @@
+"""
+Auto-reply intent routing: priority rules and agreement with the old keyword scan.
+
+The speed comparison lives in bench/intent_router.py.
+"""
+
+import pytest
+
+from config import AUTO_REPLY_INTENTS
+from utils import IntentRouter
+
+# Keyword chain of the original auto_reply_handler, checked top to bottom
+BASELINE_KEYWORDS = [
+    ('help', ['help', 'support', 'assist', 'how']),
+    ('balance', ['balance', 'money', 'usdt', 'earning', 'earn']),
+    ('withdraw', ['withdraw', 'payout', 'cash', 'payment']),
+    ('refer', ['refer', 'invite', 'friend', 'link']),
+    ('thanks', ['thank', 'thanks', 'good', 'great', 'awesome']),
+    ('greeting', ['hi', 'hello', 'hey', 'good morning', 'good evening']),
+]
+
+MESSAGES = [
+    "hello there", "how do I withdraw my usdt?", "what is my balance", "thanks a lot!",
+    "good morning", "can I invite a friend", "my payout is late", "this bot is awesome",
+    "ok", "when will I get paid", "send me the referral link please", "Hey!",
+    "I earned nothing today", "withdrawal pending for two days", "great job guys",
+]
+
+def linear_scan(text: str):
+    """Substring scan of the original handler."""
+    text = text.lower()
+    for intent, keywords in BASELINE_KEYWORDS:
+        if any(word in text for word in keywords):
+            return intent
+    return None
+
+@pytest.fixture(scope='module')
+def router():
+    return IntentRouter(AUTO_REPLY_INTENTS)
+
+@pytest.mark.parametrize('text, intent', [
+    ("good morning", 'thanks'),  # "good" is a thanks keyword, which outranks greetings
+    ("Good evening!", 'thanks'),
+    ("hello", 'greeting'),
+    ("withdrawal", 'withdraw'),
+    ("Referral link?", 'refer'),
+    ("I want to earn more", 'balance'),
+    ("how do I withdraw", 'help'),
+    ("thanks, great bot", 'thanks'),
+    ("this", None),  # no "hi" inside other words
+    ("helpful", None),  # "help" is a whole-word keyword
+    ("", None),
+])
+def test_intent_priority(router, text, intent):
+    assert router.match(text) == intent
+
+def test_agrees_with_linear_scan_on_ordinary_messages(router):
+    for text in MESSAGES:
+        assert router.match(text) == linear_scan(text), text
@@ -0,0 +1,58 @@
+"""
+Prebuilt keyboards and channel texts: no work once warm, rebuilt on channel changes.
+"""
+
+import json
+import tracemalloc
+
+import keyboards
+import utils
+from keyboards import _build_join_keyboard, get_join_keyboard, get_main_menu_keyboard
+from utils import _join_required_text, channels_signature, format_join_required
+
+def test_warm_calls_allocate_nothing():
+    # Warm the caches
+    text, keyboard, menu = format_join_required(), get_join_keyboard(), get_main_menu_keyboard()
+    text_misses = _join_required_text.cache_info().misses
+    keyboard_misses = _build_join_keyboard.cache_info().misses
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for _ in range(1000):
+            assert format_join_required() is text
+            assert get_join_keyboard() is keyboard
+            assert get_main_menu_keyboard() is menu
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    # Nothing was rebuilt, and nothing allocated by these modules is still alive
+    assert _join_required_text.cache_info().misses == text_misses
+    assert _build_join_keyboard.cache_info().misses == keyboard_misses
+    files = (utils.__file__, keyboards.__file__)
+    growth = sum(
+        stat.size_diff for stat in after.compare_to(before, 'filename')
+        if stat.traceback[0].filename in files
+    )
+    assert growth <= 0
+
+def test_channel_change_rebuilds_text_and_keyboard(monkeypatch):
+    signature = channels_signature()
+    text, keyboard = format_join_required(), get_join_keyboard()
+
+    channels = list(utils.CHANNELS) + [{"name": "New Channel", "username": "new_channel"}]
+    monkeypatch.setattr(utils, 'CHANNELS', channels)
+
+    assert channels_signature() != signature
+    new_text, new_keyboard = format_join_required(), get_join_keyboard()
+    assert new_text != text and "https://t.me/new_channel - New Channel" in new_text
+    buttons = [row[0] for row in json.loads(new_keyboard)['inline_keyboard']]
+    assert new_keyboard != keyboard
+    assert buttons[-2] == {"text": "📢 Join New Channel", "url": "https://t.me/new_channel"}
+    assert buttons[-1]['callback_data'] == "check_channels"
+
+    # Mutating the list in place is picked up as well
+    channels.pop()
+    assert channels_signature() == signature
+    assert format_join_required() is text
@@ -0,0 +1,101 @@
+"""
+Concurrent channel membership checks against a stub Bot API.
+"""
+
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import utils
+from cache import TTLCache
+from utils import is_user_in_all_channels, membership_cache
+
+CHANNELS = [{"name": f"Channel {i}", "username": f"channel{i}"} for i in range(4)]
+
+class StubBot:
+    """Answers get_chat_member after a per-channel delay, recording cancellations."""
+
+    def __init__(self, delays, statuses=None):
+        self.delays = delays
+        self.statuses = statuses or {}
+        self.calls = 0
+        self.cancelled = []
+
+    async def get_chat_member(self, chat_id: str, user_id: int):
+        self.calls += 1
+        username = chat_id.lstrip('@')
+        try:
+            await asyncio.sleep(self.delays[username])
+        except asyncio.CancelledError:
+            self.cancelled.append(username)
+            raise
+        return SimpleNamespace(status=self.statuses.get(username, 'member'))
+
+def check(bot: StubBot, user_id: int, fail_fast: bool = False):
+    """Run one check; cancellations are recorded before the loop is torn down."""
+    async def run():
+        result = await is_user_in_all_channels(bot, user_id, fail_fast=fail_fast)
+        await asyncio.sleep(0)
+        return result, list(bot.cancelled)
+
+    started = time.monotonic()
+    (is_member, missing), cancelled = asyncio.run(run())
+    return is_member, missing, cancelled, time.monotonic() - started
+
+@pytest.fixture(autouse=True)
+def channels(monkeypatch):
+    monkeypatch.setattr(utils, 'CHANNELS', CHANNELS)
+    membership_cache.clear()
+    yield
+    membership_cache.clear()
+
+def test_channels_are_checked_concurrently():
+    bot = StubBot({channel['username']: 0.2 for channel in CHANNELS})
+
+    is_member, missing, _, elapsed = check(bot, 1)
+
+    assert (is_member, missing) == (True, [])
+    assert bot.calls == 4
+    # One round-trip, not four in a row
+    assert 0.2 <= elapsed < 0.4
+
+def test_channel_past_the_deadline_is_missing(monkeypatch):
+    monkeypatch.setattr(utils, 'MEMBERSHIP_CHECK_DEADLINE', 0.2)
+    delays = {channel['username']: 0.01 for channel in CHANNELS}
+    delays['channel2'] = 5.0
+    bot = StubBot(delays)
+
+    is_member, missing, cancelled, elapsed = check(bot, 2)
+
+    assert (is_member, missing) == (False, ['Channel 2'])
+    assert elapsed < 0.5
+    assert cancelled == ['channel2']
+    # A timeout is not an answer, so it is not cached
+    assert membership_cache.peek((2, 'channel2')) is None
+
+def test_fail_fast_cancels_remaining_checks():
+    delays = {channel['username']: 1.0 for channel in CHANNELS}
+    delays['channel1'] = 0.01
+    bot = StubBot(delays, statuses={'channel1': 'left'})
+
+    is_member, missing, cancelled, elapsed = check(bot, 3, fail_fast=True)
+
+    assert (is_member, missing) == (False, ['Channel 1'])
+    assert elapsed < 0.5
+    assert sorted(cancelled) == ['channel0', 'channel2', 'channel3']
+
+def test_checks_report_cache_counters_periodically(monkeypatch, caplog):
+    cache = TTLCache(100, 60)
+    monkeypatch.setattr(utils, 'membership_cache', cache)
+    monkeypatch.setattr(utils, '_next_cache_report', 0.0)
+    bot = StubBot({channel['username']: 0 for channel in CHANNELS})
+
+    with caplog.at_level(logging.INFO, logger='utils'):
+        check(bot, 1)  # Four misses, then due for a report
+        check(bot, 1)  # Four hits, report not due again yet
+    reports = [record.getMessage() for record in caplog.records if record.getMessage().startswith('Membership cache')]
+    assert reports == ["Membership cache: 4/100 entries, 0 hits, 4 misses (0.0% hit rate), 0 evicted, 0 expired"]
+    assert cache.stats()['hit_rate'] == 50.0
@@ -0,0 +1,121 @@
+"""
+Schema migrations and the indexes behind the admin queries.
+"""
+
+import sqlite3
+
+from database import EXPORT_TABLES, MIGRATIONS, USER_SORT_COLUMNS, Database
+
+# Schema created by init_database before migrations existed
+BASELINE_SCHEMA = '''
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        full_name TEXT,
+        referrer_id INTEGER,
+        referral_count INTEGER DEFAULT 0,
+        balance REAL DEFAULT 0.0,
+        wallet_address TEXT,
+        joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (referrer_id) REFERENCES users (user_id)
+    );
+    CREATE TABLE referrals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        referrer_id INTEGER,
+        referred_id INTEGER,
+        reward_amount REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (referrer_id) REFERENCES users (user_id),
+        FOREIGN KEY (referred_id) REFERENCES users (user_id)
+    );
+'''
+
+def assert_uses_index(database: Database, sql: str, table: str, index: str, params=()):
+    """Assert the query reads `table` through `index` and never scans it row by row."""
+    rows = database.get_connection().execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+    details = [row[-1] for row in rows]
+    assert any(index in detail for detail in details), details
+    assert f'SCAN {table}' not in details, details
+
+def test_admin_queries_use_indexes(tmp_path):
+    database = Database(str(tmp_path / "t.db"))
+
+    # /users listing, first page and following pages, for every sort key
+    for sort, column in USER_SORT_COLUMNS.items():
+        assert_uses_index(database, f'''
+            SELECT user_id, username FROM users
+            ORDER BY {column} DESC, user_id DESC LIMIT 50
+        ''', 'users', f'idx_users_sort_{sort}')
+        assert_uses_index(database, f'''
+            SELECT user_id, username FROM users
+            WHERE ({column}, user_id) < (?, ?)
+            ORDER BY {column} DESC, user_id DESC LIMIT 50
+        ''', 'users', f'idx_users_sort_{sort}', (0, 0))
+
+    # Referrals made by one user (user detail page)
+    assert_uses_index(database, '''
+        SELECT user_id, username, full_name, joined_at
+        FROM users WHERE referrer_id = ?
+        ORDER BY joined_at DESC
+    ''', 'users', 'idx_users_referrer_id', (1,))
+
+    # Referral counts, per referrer (reconciliation) and for one user
+    assert_uses_index(database, 'SELECT referrer_id, COUNT(*) FROM referrals GROUP BY referrer_id',
+                      'referrals', 'idx_referrals_referrer_id')
+    assert_uses_index(database, 'SELECT COUNT(*) FROM referrals WHERE referrer_id = ?',
+                      'referrals', 'idx_referrals_referrer_id', (1,))
+
+    # Incremental exports, ordered by and filtered on the table's timestamp
+    for table, column in EXPORT_TABLES.items():
+        assert_uses_index(database, f'SELECT * FROM {table} WHERE {column} > ? ORDER BY {column}',
+                          table, f'idx_{table}_{column}', ('2024-01-01 00:00:00',))
+
+def test_baseline_database_is_migrated(tmp_path):
+    path = str(tmp_path / "baseline.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO users (user_id, username, balance) VALUES (1, 'alice', 0.5)")
+    conn.execute("INSERT INTO users (user_id, username, referrer_id) VALUES (2, 'bob', 1)")
+    conn.execute("INSERT INTO referrals (referrer_id, referred_id, reward_amount) VALUES (1, 2, 0.1)")
+    conn.execute("INSERT INTO referrals (referrer_id, referred_id, reward_amount) VALUES (1, 2, 0.1)")
+    conn.commit()
+    conn.close()
+
+    database = Database(path)
+    conn = database.get_connection()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    assert version >= 10
+    assert version == MIGRATIONS[-1][0]
+
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(users)')]
+    assert 'start_count' in columns and 'last_start' in columns
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'stats', 'broadcast_jobs', 'events', 'activity_rollups', 'ledger'} <= tables
+
+    # Existing rows survive; the duplicate referral is removed
+    assert conn.execute('SELECT username, balance FROM users WHERE user_id = 1').fetchone() == ('alice', 0.5)
+    assert conn.execute('SELECT COUNT(*) FROM referrals').fetchone()[0] == 1
+
+    # Migrating again is a no-op
+    assert database.migrate() == version
+
+def test_user_list_pages_through_null_sort_values(tmp_path):
+    database = Database(str(tmp_path / "t.db"))
+    conn = database.get_connection()
+    for user_id in range(1, 31):
+        # Every third user has no balance, referral count or join date
+        missing = user_id % 3 == 0
+        conn.execute(
+            'INSERT INTO users (user_id, username, balance, referral_count, joined_at) VALUES (?, ?, ?, ?, ?)',
+            (user_id, f'user{user_id}', None if missing else user_id % 5 * 0.1,
+             None if missing else user_id % 4, None if missing else f'2024-01-{user_id % 7 + 1:02d} 00:00:00'))
+    conn.commit()
+
+    for sort in USER_SORT_COLUMNS:
+        seen, after = [], None
+        while True:
+            rows, after = database.list_users(sort, after, limit=4)
+            seen.extend(row[0] for row in rows)
+            if after is None:
+                break
+        assert sorted(seen) == list(range(1, 31)), sort
@@ -0,0 +1,95 @@
+"""
+Referral crediting on /start and the referrer notification.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import handlers
+from database import Database
+from notifier import ReferralNotifier
+
+def test_only_registered_referrers_are_credited(tmp_path):
+    database = Database(str(tmp_path / "t.db"))
+    database.record_start(1, "alice", "Alice")
+
+    assert database.record_start(2, "bob", "Bob", referrer_id=1) == (1, True, 1)
+    # Forged, self and repeated referrals credit nobody
+    assert database.record_start(3, "carol", "Carol", referrer_id=999) == (1, True, None)
+    assert database.record_start(4, "dave", "Dave", referrer_id=4) == (1, True, None)
+    assert database.record_start(2, "bob", "Bob", referrer_id=1) == (2, False, None)
+
+    conn = database.get_connection()
+    assert conn.execute('SELECT referrer_id, referred_id FROM referrals').fetchall() == [(1, 2)]
+    assert conn.execute('SELECT user_id FROM ledger').fetchall() == [(1,)]
+    assert conn.execute('SELECT referrer_id FROM users WHERE user_id IN (3, 4)').fetchall() == [(None,), (None,)]
+
+class StubMessage:
+    def __init__(self, user_id: int, args: str):
+        self.from_user = SimpleNamespace(id=user_id, username=f"user{user_id}", full_name=f"User {user_id}")
+        self._args = args
+        self.answers = []
+
+    def get_args(self):
+        return self._args
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+class MemberBot:
+    async def get_chat_member(self, chat_id, user_id):
+        return SimpleNamespace(status='member')
+
+@pytest.fixture
+def notified(monkeypatch):
+    calls = []
+    monkeypatch.setattr(handlers.referral_notifier, 'notify', lambda *args: calls.append(args))
+    return calls
+
+def run_start(user_id: int, args: str = ""):
+    asyncio.run(handlers.start_handler(StubMessage(user_id, args), MemberBot()))
+
+def test_forged_referrer_is_not_notified(notified):
+    run_start(500_001)
+    run_start(500_002, "500001")
+    run_start(500_003, "123456789")
+    run_start(500_004, "not-a-number")
+    assert notified == [(500_001, "User 500002")]
+
+class StubStatsDatabase:
+    async def get_user_stats(self, user_id: int):
+        return 0.2, 2
+
+class SlowBot:
+    """Holds every send_message until released."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = asyncio.Event()
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.started.set()
+        await self.release.wait()
+        self.sent.append(chat_id)
+
+def test_shutdown_finishes_the_batch_in_flight():
+    async def run():
+        bot = SlowBot()
+        notifier = ReferralNotifier(StubStatsDatabase(), window=0.01)
+        notifier.start(bot)
+        notifier.notify(1, "Bob")
+        await bot.started.wait()
+        notifier.notify(2, "Carol")  # Queued behind the batch being sent
+
+        stopping = asyncio.ensure_future(notifier.stop())
+        await asyncio.sleep(0.01)
+        bot.release.set()
+        await stopping
+        return bot.sent, notifier.sent
+
+    sent, count = asyncio.run(run())
+    assert sorted(sent) == [1, 2]
+    assert count == 2
@@ -0,0 +1,161 @@
+"""
+Update scheduling: per-user ordering, the concurrency cap and backpressure.
+"""
+
+import asyncio
+import time
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher.webhook import BOT_DISPATCHER_KEY
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import webhook
+from polling import BackpressureBot
+from scheduler import LatencyHistogram, UpdateScheduler
+
+TOKEN = '123456:test-token'
+
+def message_update(update_id: int, user_id: int, text: str = 'hello') -> dict:
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'User {user_id}'}
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id, 'date': int(time.time()), 'text': text,
+            'chat': {'id': user_id, 'type': 'private'}, 'from': user,
+        },
+    }
+
+def make_dispatcher(update_scheduler: UpdateScheduler, handler) -> Dispatcher:
+    dp = Dispatcher(Bot(token=TOKEN))
+    dp.middleware.setup(update_scheduler)
+    dp.register_message_handler(handler)
+    return dp
+
+async def dispatch(dp: Dispatcher, updates):
+    await asyncio.gather(*(dp.updates_handler.notify(types.Update(**update)) for update in updates))
+
+def test_percentiles_never_exceed_the_maximum():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(0.5) == 0.0
+    for seconds in (0.0015, 0.004, 1.788):
+        histogram.observe(seconds)
+    # Bucket upper bounds, except where the bucket's bound is above every sample
+    assert histogram.percentile(0.33) == 2
+    assert histogram.percentile(0.5) == 5
+    assert histogram.percentile(0.99) == 1788.0
+    histogram.observe(12.5)  # Overflow bucket
+    assert histogram.percentile(0.99) == 12500.0
+    histogram.observe(13.3333333)
+    assert histogram.summary()['p99'] == 13333.33
+
+def test_one_users_updates_run_in_order():
+    log = []
+
+    async def handler(message: types.Message):
+        log.append((message.from_user.id, 'start', message.message_id))
+        await asyncio.sleep(0.01)
+        log.append((message.from_user.id, 'end', message.message_id))
+
+    async def run():
+        dp = make_dispatcher(UpdateScheduler(concurrency=10), handler)
+        await dispatch(dp, [message_update(i, 1 if i % 2 else 2) for i in range(1, 9)])
+
+    asyncio.run(run())
+    for user_id in (1, 2):
+        steps = [(step, message_id) for user, step, message_id in log if user == user_id]
+        message_ids = [message_id for step, message_id in steps if step == 'start']
+        assert message_ids == sorted(message_ids)
+        # Each update finishes before the user's next one starts
+        assert steps == [(step, message_id) for message_id in message_ids for step in ('start', 'end')]
+    # ...while different users run side by side
+    assert log[:2] == [(1, 'start', 1), (2, 'start', 2)]
+
+def test_concurrency_is_capped():
+    update_scheduler = UpdateScheduler(concurrency=3)
+    running, peak = 0, 0
+
+    async def handler(message: types.Message):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    async def run():
+        dp = make_dispatcher(update_scheduler, handler)
+        await dispatch(dp, [message_update(i, i) for i in range(1, 13)])
+
+    asyncio.run(run())
+    assert peak == 3
+    stats = update_scheduler.stats()
+    assert stats['total']['count'] == 12
+    assert stats['load'] == {'pending': 0, 'running': 0, 'users': 0, 'refused': 0}
+
+def test_saturated_webhook_refuses_with_429(monkeypatch):
+    update_scheduler = UpdateScheduler(max_pending=2)
+    monkeypatch.setattr(webhook, 'update_scheduler', update_scheduler)
+    release = asyncio.Event()
+    handled = []
+
+    async def handler(message: types.Message):
+        await release.wait()
+        handled.append(message.message_id)
+
+    async def run():
+        app = web.Application()
+        app[BOT_DISPATCHER_KEY] = make_dispatcher(update_scheduler, handler)
+        app.router.add_route('*', '/webhook', webhook.SecretTokenWebhookHandler)
+        async with TestClient(TestServer(app)) as client:
+            for update_id in (1, 2):
+                response = await client.post('/webhook', json=message_update(update_id, update_id))
+                assert response.status == 200
+            await asyncio.sleep(0.01)
+            assert update_scheduler.saturated
+
+            response = await client.post('/webhook', json=message_update(3, 3))
+            assert response.status == 429
+            assert response.headers['Retry-After'] == str(webhook.UPDATE_RETRY_AFTER)
+            assert update_scheduler.refused == 1
+
+            release.set()
+            await webhook.drain_updates()
+            assert not update_scheduler.saturated
+            response = await client.post('/webhook', json=message_update(3, 3))
+            assert response.status == 200
+            await webhook.drain_updates()
+
+    asyncio.run(run())
+    assert sorted(handled) == [1, 2, 3]
+
+def test_polling_waits_while_saturated(monkeypatch):
+    update_scheduler = UpdateScheduler(max_pending=2)
+    release = asyncio.Event()
+    fetches = []
+
+    async def get_updates(self, *args, **kwargs):
+        fetches.append(update_scheduler.pending)
+        return []
+
+    async def handler(message: types.Message):
+        await release.wait()
+
+    monkeypatch.setattr(Bot, 'get_updates', get_updates)
+
+    async def run():
+        bot = BackpressureBot(token=TOKEN, scheduler=update_scheduler)
+        dp = make_dispatcher(update_scheduler, handler)
+        batch = asyncio.ensure_future(dispatch(dp, [message_update(1, 1), message_update(2, 2)]))
+        await asyncio.sleep(0.01)
+        assert update_scheduler.saturated
+
+        fetch = asyncio.ensure_future(bot.get_updates(timeout=20))
+        await asyncio.sleep(0.05)
+        assert fetches == [] and not fetch.done()
+
+        release.set()
+        await batch
+        assert await fetch == []
+        assert fetches == [0]
+
+    asyncio.run(run())
@@ -2,54 +2,163 @@
 Utility functions for the Telegram bot.
 """
 
+import asyncio
+import functools
+import json
 import logging
-from typing import List, Dict, Any
+import re
+import time
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from aiogram import Bot
 from aiogram.utils.exceptions import ChatNotFound, BotBlocked
 
-from config import CHANNELS
+from cache import TTLCache
+from config import (
+    CHANNELS, MESSAGES, MEMBERSHIP_CHECK_DEADLINE, MEMBERSHIP_CACHE_SIZE,
+    MEMBERSHIP_CACHE_POSITIVE_TTL, MEMBERSHIP_CACHE_NEGATIVE_TTL, MEMBERSHIP_CACHE_STATS_INTERVAL,
+    AUTO_REPLY_INTENTS, AUTO_REPLY_KEYWORDS_FILE,
+)
 
 logger = logging.getLogger(__name__)
 
-async def is_user_in_all_channels(bot: Bot, user_id: int) -> tuple[bool, List[str]]:
+# Membership results keyed by (user_id, channel username)
+membership_cache = TTLCache(MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_CACHE_POSITIVE_TTL)
+
+# When membership checks next report the cache counters
+_next_cache_report = time.monotonic() + MEMBERSHIP_CACHE_STATS_INTERVAL
+
+def log_membership_cache_stats():
+    """Write the membership cache counters to the log."""
+    s = membership_cache.stats()
+    logger.info(f"Membership cache: {s['size']}/{s['maxsize']} entries, {s['hits']} hits, "
+                f"{s['misses']} misses ({s['hit_rate']}% hit rate), {s['evictions']} evicted, "
+                f"{s['expirations']} expired")
+
+async def _check_channel(bot: Bot, channel: Dict[str, Any], user_id: int) -> bool:
+    """
+    Check if a user is a member of a single channel, using membership_cache.
+    
+    Confirmed memberships are cached for MEMBERSHIP_CACHE_POSITIVE_TTL and
+    non-memberships for MEMBERSHIP_CACHE_NEGATIVE_TTL. Lookup errors are not
+    cached.
+    
+    Args:
+        bot: The bot instance
+        channel: Channel entry from config.CHANNELS
+        user_id: Telegram user ID to check
+        
+    Returns:
+        bool: True if the user is a member of the channel
+    """
+    key = (user_id, channel['username'])
+    cached = membership_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    is_member = await _fetch_channel_membership(bot, channel, user_id)
+    if is_member is not None:
+        ttl = MEMBERSHIP_CACHE_POSITIVE_TTL if is_member else MEMBERSHIP_CACHE_NEGATIVE_TTL
+        membership_cache.set(key, is_member, ttl)
+    return bool(is_member)
+
+async def _fetch_channel_membership(bot: Bot, channel: Dict[str, Any], user_id: int) -> Optional[bool]:
+    """
+    Ask the Bot API whether a user is a member of a channel.
+    
+    Returns:
+        Optional[bool]: Membership, or None if it could not be determined
+    """
+    try:
+        chat_member = await bot.get_chat_member(f"@{channel['username']}", user_id)
+        
+        # Check if user has appropriate status
+        if chat_member.status not in ["member", "administrator", "creator"]:
+            logger.info(f"User {user_id} not a member of {channel['name']} (status: {chat_member.status})")
+            return False
+        logger.debug(f"User {user_id} verified in {channel['name']} (status: {chat_member.status})")
+        return True
+            
+    except (ChatNotFound, BotBlocked) as specific_error:
+        if isinstance(specific_error, ChatNotFound):
+            logger.error(f"Channel @{channel['username']} not found")
+        else:  # BotBlocked
+            logger.warning(f"Bot blocked by user {user_id}")
+        return False
+    except Exception as e:
+        error_msg = str(e).lower()
+        if "user not found" in error_msg:
+            logger.warning(f"User {user_id} not found when checking {channel['username']}")
+            return False
+        logger.error(f"Error checking membership for user {user_id} in {channel['username']}: {e}")
+        return None
+
+def invalidate_membership(user_id: int, negative_only: bool = True):
+    """
+    Drop cached membership results for a user.
+    
+    Args:
+        user_id: Telegram user ID
+        negative_only: Only drop failed checks, keeping confirmed memberships
+    """
+    for channel in CHANNELS:
+        key = (user_id, channel['username'])
+        if not negative_only or membership_cache.peek(key) is False:
+            membership_cache.invalidate(key)
+
+async def is_user_in_all_channels(bot: Bot, user_id: int, fail_fast: bool = False) -> tuple[bool, List[str]]:
     """
     Check if a user is a member of all required channels.
     
+    All channels are checked concurrently under a shared deadline
+    (MEMBERSHIP_CHECK_DEADLINE); channels that do not answer in time count
+    as missing.
+    
     Args:
         bot: The bot instance
         user_id: Telegram user ID to check
+        fail_fast: Cancel the remaining checks as soon as one channel fails.
+            The missing list then only holds the channels confirmed so far.
         
     Returns:
         tuple: (is_member_of_all, list_of_missing_channels)
     """
-    missing_channels = []
+    tasks = {
+        asyncio.ensure_future(_check_channel(bot, channel, user_id)): channel
+        for channel in CHANNELS
+    }
+    failed = set()
+    pending = set(tasks)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + MEMBERSHIP_CHECK_DEADLINE
     
-    for channel in CHANNELS:
-        try:
-            chat_member = await bot.get_chat_member(f"@{channel['username']}", user_id)
-            
-            # Check if user has appropriate status
-            if chat_member.status not in ["member", "administrator", "creator"]:
-                missing_channels.append(channel['name'])
-                logger.info(f"User {user_id} not a member of {channel['name']} (status: {chat_member.status})")
-            else:
-                logger.debug(f"User {user_id} verified in {channel['name']} (status: {chat_member.status})")
-                
-        except (ChatNotFound, BotBlocked) as specific_error:
-            if isinstance(specific_error, ChatNotFound):
-                logger.error(f"Channel @{channel['username']} not found")
-            else:  # BotBlocked
-                logger.warning(f"Bot blocked by user {user_id}")
-            missing_channels.append(channel['name'])
-        except Exception as e:
-            error_msg = str(e).lower()
-            if "user not found" in error_msg:
-                logger.warning(f"User {user_id} not found when checking {channel['username']}")
-            else:
-                logger.error(f"Error checking membership for user {user_id} in {channel['username']}: {e}")
-            missing_channels.append(channel['name'])
+    try:
+        while pending:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.result():
+                    failed.add(task)
+            if fail_fast and failed:
+                break
+    finally:
+        for task in pending:
+            task.cancel()
+    
+    if pending and not (fail_fast and failed):
+        logger.warning(f"Membership check for user {user_id} timed out on {len(pending)} channel(s)")
+        failed |= pending
     
-    is_member_of_all = len(missing_channels) == 0
+    global _next_cache_report
+    now = time.monotonic()
+    if now >= _next_cache_report:
+        _next_cache_report = now + MEMBERSHIP_CACHE_STATS_INTERVAL
+        log_membership_cache_stats()
+    
+    # Keep the configured channel order in the result
+    missing_channels = [tasks[task]['name'] for task in tasks if task in failed]
+    is_member_of_all = not failed and not pending
     return is_member_of_all, missing_channels
 
 async def get_user_info_string(user) -> str:
@@ -68,6 +177,40 @@ async def get_user_info_string(user) -> str:
     user_info += f"\n🆔 ID: {user.id}"
     return user_info
 
+# Last result of channels_signature(), reused while the channel list is unchanged
+_channels_signature: tuple = ()
+
+def channels_signature() -> tuple:
+    """
+    Get a hashable snapshot of config.CHANNELS.
+
+    Texts and keyboards derived from the channel list are cached on this
+    value, so they are rebuilt only when the list changes. The previous
+    snapshot is returned as long as it still matches the list, so the
+    per-reply path does not build a new tuple.
+
+    Returns:
+        tuple: (name, username) for each channel
+    """
+    global _channels_signature
+    signature = _channels_signature
+    if len(signature) == len(CHANNELS):
+        for (name, username), channel in zip(signature, CHANNELS):
+            if channel['name'] != name or channel['username'] != username:
+                break
+        else:
+            return signature
+    _channels_signature = tuple((channel['name'], channel['username']) for channel in CHANNELS)
+    return _channels_signature
+
+@functools.lru_cache(maxsize=4)
+def _channel_list_text(channels: tuple) -> str:
+    """Build the channel list text for a channels signature."""
+    channel_list = "📋 Required Channels:\n"
+    for i, (name, username) in enumerate(channels, 1):
+        channel_list += f"{i}. {name} (@{username})\n"
+    return channel_list
+
 def format_channel_list() -> str:
     """
     Format the required channels list for display.
@@ -75,7 +218,92 @@ def format_channel_list() -> str:
     Returns:
         str: Formatted channel list
     """
-    channel_list = "📋 Required Channels:\n"
-    for i, channel in enumerate(CHANNELS, 1):
-        channel_list += f"{i}. {channel['name']} (@{channel['username']})\n"
-    return channel_list
+    return _channel_list_text(channels_signature())
+
+@functools.lru_cache(maxsize=4)
+def _join_required_text(channels: tuple) -> str:
+    """Build the join request text for a channels signature."""
+    message_text = MESSAGES["join_required"] + "\n\n"
+    for name, username in channels:
+        message_text += f"🔗 https://t.me/{username} - {name}\n"
+    message_text += "\nClick the buttons below to join each channel:"
+    return message_text
+
+def format_join_required() -> str:
+    """
+    Format the message asking a user to join the required channels.
+    
+    Returns:
+        str: Join request with a link to each channel
+    """
+    return _join_required_text(channels_signature())
+
+class IntentRouter:
+    """
+    Maps free text to an intent with one precompiled regex.
+
+    All keywords are compiled into a single alternation, ordered by intent
+    priority and matched on word boundaries in one pass over the message.
+    Matched words are mapped back to their intent with a dict lookup.
+    """
+
+    def __init__(self, intents: Sequence[Tuple[str, Sequence[str]]]):
+        self.intents = [name for name, _ in intents]
+        self._exact: Dict[str, int] = {}
+        self._prefixes: List[Tuple[str, int]] = []
+        alternatives = []
+        for index, (_, keywords) in enumerate(intents):
+            for keyword in keywords:
+                keyword = ' '.join(keyword.lower().split())
+                if keyword.endswith('*') and len(keyword) > 1:
+                    self._prefixes.append((keyword[:-1], index))
+                    alternatives.append(re.escape(keyword[:-1]) + r'\w*')
+                elif keyword and keyword not in self._exact:
+                    self._exact[keyword] = index
+                    alternatives.append(re.escape(keyword))
+        self.pattern = re.compile(rf"\b(?:{'|'.join(alternatives)})\b") if alternatives else None
+
+    def _intent_index(self, word: str) -> int:
+        """Priority index of the intent a matched word belongs to."""
+        best = self._exact.get(word, len(self.intents))
+        for prefix, index in self._prefixes:
+            if index < best and word.startswith(prefix):
+                best = index
+        return best
+
+    def match(self, text: str) -> Optional[str]:
+        """
+        Get the highest-priority intent with a keyword in the text.
+
+        Args:
+            text: Message text (any case)
+
+        Returns:
+            Optional[str]: Intent name, or None if no keyword matches
+        """
+        if self.pattern is None:
+            return None
+        best = len(self.intents)
+        for word in self.pattern.findall(text.lower()):
+            best = min(best, self._intent_index(word))
+            if best == 0:
+                break
+        return self.intents[best] if best < len(self.intents) else None
+
+def load_auto_reply_intents() -> List[Tuple[str, List[str]]]:
+    """
+    Get the auto-reply keyword table, from AUTO_REPLY_KEYWORDS_FILE if set.
+
+    Returns:
+        List[Tuple[str, List[str]]]: (intent, keywords) in priority order
+    """
+    if AUTO_REPLY_KEYWORDS_FILE:
+        try:
+            with open(AUTO_REPLY_KEYWORDS_FILE, encoding='utf-8') as f:
+                return list(json.load(f).items())
+        except (OSError, ValueError, AttributeError) as e:
+            logger.error(f"Could not load {AUTO_REPLY_KEYWORDS_FILE}, using built-in keywords: {e}")
+    return list(AUTO_REPLY_INTENTS)
+
+# Router for auto_reply_handler, built once at import
+auto_reply_router = IntentRouter(load_auto_reply_intents())
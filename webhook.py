@@ -0,0 +1,66 @@
+"""
+Webhook endpoint for receiving Telegram updates over HTTPS.
+"""
+
+import asyncio
+import hmac
+import logging
+from typing import Set
+
+from aiohttp import web
+from aiogram.dispatcher.webhook import WebhookRequestHandler
+
+from config import WEBHOOK_SECRET, UPDATE_RETRY_AFTER
+from scheduler import update_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Header Telegram sends with the secret_token given to setWebhook
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class SecretTokenWebhookHandler(WebhookRequestHandler):
+    """
+    Webhook handler that authenticates Telegram and acknowledges at once.
+
+    aiogram 2 does not check the secret token, so requests without the
+    configured X-Telegram-Bot-Api-Secret-Token are rejected here. Updates
+    are handed to the dispatcher as background tasks and answered with 200
+    immediately, so Telegram can deliver the next update (up to
+    WEBHOOK_MAX_CONNECTIONS in parallel) without waiting for handlers.
+    While the update scheduler's backlog is full, requests are refused with
+    429 and Retry-After instead, so Telegram holds the updates meanwhile.
+    """
+
+    # Updates being processed; holds task references until they finish
+    tasks: Set[asyncio.Task] = set()
+
+    async def post(self):
+        self.validate_ip()
+        token = self.request.headers.get(SECRET_TOKEN_HEADER, '')
+        if not hmac.compare_digest(token.encode(), WEBHOOK_SECRET.encode()):
+            logger.warning(f"Rejected webhook request without a valid secret token from {self.request.remote}")
+            raise web.HTTPUnauthorized()
+
+        if update_scheduler.saturated:
+            # Not acknowledged, so Telegram keeps the update and redelivers it later
+            update_scheduler.refuse()
+            raise web.HTTPTooManyRequests(headers={'Retry-After': str(UPDATE_RETRY_AFTER)})
+
+        dispatcher = self.get_dispatcher()
+        update = await self.parse_update(dispatcher.bot)
+
+        task = asyncio.ensure_future(dispatcher.updates_handler.notify(update))
+        self.tasks.add(task)
+        task.add_done_callback(_update_done)
+        return web.Response(text='ok')
+
+def _update_done(task: asyncio.Task):
+    """Forget a finished update task and log its failure, if any."""
+    SecretTokenWebhookHandler.tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Error processing update: {task.exception()}")
+
+async def drain_updates(timeout: float = 10.0):
+    """Wait for updates still being processed, e.g. before shutting down."""
+    if SecretTokenWebhookHandler.tasks:
+        await asyncio.wait(SecretTokenWebhookHandler.tasks, timeout=timeout)